@@ -1,19 +1,79 @@
 #!/usr/bin/env python3
 
+import time
+_started = time.perf_counter()
+
+import hashlib
+import json
 import os
 import discord
 from discord.ext import commands
 
+from util import changelog, db, migrations
+
+_imported = time.perf_counter()
+
+EXTENSIONS = ['cogs.charactercmds', 'cogs.rollcmds', 'cogs.itemcmds', 'cogs.admincmds']
+
+# Hash of the command definitions last pushed to Discord, so unchanged commands are not synced again
+COMMAND_HASH_FILE = os.environ.get('BALLROOM_COMMAND_HASH_FILE', 'ballroom-commands.sha256')
+
+# To spread the bot over several processes sharing one database, start each with the same BALLROOM_SHARD_COUNT
+# and its own comma-separated BALLROOM_SHARD_IDS. Unset, this process runs every shard Discord recommends.
+SHARD_COUNT = int(os.environ['BALLROOM_SHARD_COUNT']) if os.environ.get('BALLROOM_SHARD_COUNT') else None
+SHARD_IDS = [int(x) for x in os.environ['BALLROOM_SHARD_IDS'].split(',')] if os.environ.get('BALLROOM_SHARD_IDS') else None
+
+def command_tree_hash(bot: commands.Bot) -> str:
+    payload = {
+        'application_id': bot.application_id,
+        'commands': sorted((x.to_dict(bot.tree) for x in bot.tree.get_commands()), key=lambda x: (x['type'], x['name'])),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def read_synced_hash() -> str:
+    try:
+        with open(COMMAND_HASH_FILE, encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ''
+
+def write_synced_hash(value: str) -> None:
+    with open(COMMAND_HASH_FILE, 'w', encoding='utf-8') as f:
+        f.write(value + '\n')
+
+class Ballroom(commands.AutoShardedBot):
+    # setup_hook runs once after login, unlike on_ready which runs again after every reconnect
+    async def setup_hook(self) -> None:
+        start = time.perf_counter()
+        migrated = await db.run(migrations.migrate)
+        if SHARD_IDS is not None:
+            # Other processes write to the same database, so their changes have to reach the caches here
+            await db.run(changelog.start)
+        schema_ready = time.perf_counter()
+
+        for extension in EXTENSIONS:
+            await self.load_extension(extension)
+        loaded = time.perf_counter()
+
+        # Commands are global, so only the process running shard 0 syncs them
+        tree_hash = command_tree_hash(self)
+        synced = (SHARD_IDS is None or 0 in SHARD_IDS) and tree_hash != read_synced_hash()
+        if synced:
+            await self.tree.sync()
+            write_synced_hash(tree_hash)
+        done = time.perf_counter()
+
+        print(f'Startup: imports {(_imported - _started) * 1000:.0f} ms, '
+              f'schema {(schema_ready - start) * 1000:.0f} ms ({migrated} migrations), '
+              f'extensions {(loaded - schema_ready) * 1000:.0f} ms, '
+              f'command sync {(done - loaded) * 1000:.0f} ms' + ('' if synced else ' (skipped)'))
+
 intents = discord.Intents.default()
-bot = commands.Bot(command_prefix=commands.when_mentioned, intents=intents)
+bot = Ballroom(command_prefix=commands.when_mentioned, intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
 
 @bot.event
 async def on_ready():
-    await bot.load_extension(name='cogs.charactercmds')
-    await bot.load_extension(name='cogs.rollcmds')
-    await bot.load_extension(name='cogs.itemcmds')
-
-    await bot.tree.sync()
     print(f'We have logged in as {bot.user}')
 
-bot.run(os.environ['BALLROOM_TOKEN'])
+if __name__ == '__main__':
+    bot.run(os.environ['BALLROOM_TOKEN'])
@@ -0,0 +1,4 @@
+import os
+
+# Benchmarks never touch the bot's real database unless asked to.
+os.environ.setdefault('BALLROOM_DB', ':memory:')
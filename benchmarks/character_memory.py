@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Compares the memory footprint of many cached characters with the previous dict-based layout.
+# Run from the repository root: python -m benchmarks.character_memory
+
+import argparse
+import time
+import tracemalloc
+
+from models.attribute import Attribute
+from models.character import Character
+from models.skill import Skill
+from models.slot import Slot
+from models import stats
+
+class DictCharacter:
+    # The Character layout before stats moved into an array, kept here for comparison
+    def __init__(self, db_id, user_id, name, description, image_url, health, morale) -> None:
+        self.db_id = db_id
+        self.user_id = user_id
+        self.name = name
+        self.description = description
+        self.image_url = image_url
+        self.health = health
+        self.morale = morale
+        self._attributes = { x:0 for x in Attribute.__members__.values() }
+        self._skills = { x:0 for x in Skill.__members__.values() }
+        self._equipped_items = { x:None for x in Slot.__members__.values() }
+        self._inventory = {}
+
+    def get_effective_skill(self, skill: Skill) -> int:
+        return self._attributes[stats.get_attribute(skill)] + self._skills[skill]
+
+def measure(factory, count: int) -> tuple[int, list]:
+    tracemalloc.start()
+    characters = [factory(i, i, f'Character {i}', '', None, 0, 0) for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, characters
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--characters', type=int, default=100_000)
+    args = parser.parse_args()
+
+    before, legacy = measure(DictCharacter, args.characters)
+    after, current = measure(Character, args.characters)
+    print(f'{args.characters:,} characters: dicts {before / 2**20:.1f} MiB ({before // args.characters} B each), '
+          f'array {after / 2**20:.1f} MiB ({after // args.characters} B each)')
+
+    start = time.perf_counter()
+    for character in legacy:
+        [character.get_effective_skill(skill) for skill in Skill]
+    dict_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for character in current:
+        character.get_effective_skills()
+    array_time = time.perf_counter() - start
+    print(f'all effective skills: dicts {dict_time / args.characters * 1e6:.2f} us, '
+          f'array {array_time / args.characters * 1e6:.2f} us per character')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Measures interaction latency and event loop lag while a large write is running.
+# Run from the repository root: python -m benchmarks.event_loop_latency
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from models.item_type import ItemType
+from services import charactersvc
+from util import db, migrations
+
+USER_ID = 1
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def large_write(rows: int, batch: int) -> None:
+    cursor = db.conn.cursor()
+    names = (f'bench item {batch}-{i}' for i in range(rows))
+    cursor.executemany('INSERT INTO item (user_id, name, name_key, description, item_type) VALUES (?, ?, ?, ?, ?)',
+                       ((USER_ID, name, db.name_key(name), 'benchmark', ItemType.MISC.name) for name in names))
+    cursor.close()
+    db.conn.commit()
+
+async def probe_loop_lag(stop: asyncio.Event, samples: list[float], interval: float) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+async def probe_interactions(stop: asyncio.Event, samples: list[float], blocking: bool) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        if blocking:
+            charactersvc.get_active_character_by_user_id(USER_ID)
+        else:
+            await db.run(charactersvc.get_active_character_by_user_id, USER_ID)
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(0.005)
+
+async def run_scenario(blocking: bool, rows: int, batch: int) -> dict:
+    lag, latency = [], []
+    stop = asyncio.Event()
+    probes = [asyncio.create_task(probe_loop_lag(stop, lag, 0.001)),
+              asyncio.create_task(probe_interactions(stop, latency, blocking))]
+
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    if blocking:
+        large_write(rows, batch)
+    else:
+        await db.run(large_write, rows, batch)
+    write_time = time.perf_counter() - start
+    await asyncio.sleep(0.05)
+
+    stop.set()
+    await asyncio.gather(*probes)
+
+    return {
+        'write_s': write_time,
+        'interactions': len(latency),
+        'latency_p50_ms': percentile(latency, 50) * 1000,
+        'latency_p99_ms': percentile(latency, 99) * 1000,
+        'latency_max_ms': max(latency) * 1000,
+        'loop_lag_mean_ms': statistics.fmean(lag) * 1000,
+        'loop_lag_max_ms': max(lag) * 1000,
+    }
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200_000, help='Rows inserted by the large write.')
+    args = parser.parse_args()
+
+    migrations.migrate()
+    await db.run(charactersvc.create_character, USER_ID, 'Harry')
+
+    for batch, (label, blocking) in enumerate((('on event loop', True), ('on DB worker', False))):
+        result = await run_scenario(blocking, args.rows, batch)
+        print(f'{label:>14}: ' + ', '.join(f'{k}={v:.2f}' if isinstance(v, float) else f'{k}={v}' for k, v in result.items()))
+
+if __name__ == '__main__':
+    asyncio.run(main())
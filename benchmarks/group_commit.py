@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+# Measures write throughput of a file-backed database with and without group commit.
+# Run from the repository root: python -m benchmarks.group_commit
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from models.skill import Skill
+from services import charactersvc
+from util import db, migrations
+
+async def burst(users: int, writes_per_user: int) -> float:
+    skills = list(Skill)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        db.run(charactersvc.set_skill, user_id, skills[i % len(skills)].name, i % 7)
+        for user_id in range(users) for i in range(writes_per_user)
+    ))
+    return time.perf_counter() - start
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--writes', type=int, default=40, help='Writes issued concurrently per user.')
+    parser.add_argument('--synchronous', default='FULL', help='PRAGMA synchronous level for the run.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db.SYNCHRONOUS = args.synchronous
+        # Write every stat edit as its own commit, otherwise they are batched before group commit sees them
+        charactersvc.STAT_WRITE_DELAY_MS = 0
+        db.open_database(os.path.join(directory, 'bench.db'))
+        migrations.migrate()
+
+        for user_id in range(args.users):
+            await db.run(charactersvc.create_character, user_id, f'Character {user_id}')
+
+        total = args.users * args.writes
+        for window in (0, 2, 5):
+            db.GROUP_COMMIT_MS = window
+            elapsed = await burst(args.users, args.writes)
+            print(f'group commit {window} ms: {total} writes in {elapsed:.2f}s ({total / elapsed:,.0f} writes/s)')
+
+        db.app_exit()
+
+if __name__ == '__main__':
+    asyncio.run(main())
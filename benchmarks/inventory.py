@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# Compares the batched inventory loader with the previous one-query-per-item approach.
+# Run from the repository root: python -m benchmarks.inventory
+
+import argparse
+import time
+
+from models.item import construct_item
+from models.item_type import ItemType
+from models.itemstat import construct_itemstat
+from models.skill import Skill
+from services import charactersvc, itemsvc
+from util import db, migrations
+
+USER_ID = 1
+
+def seed(character_name: str, entries: int, effects: int) -> int:
+    # Every size gets a character of its own, names are unique per user
+    charactersvc.create_character(USER_ID, character_name)
+    character_id = charactersvc.get_active_character_by_user_id(USER_ID).db_id
+    skills = list(Skill)
+
+    cursor = db.conn.cursor()
+    for i in range(entries):
+        name = f'item {character_id}-{i}'
+        cursor.execute('INSERT INTO item (user_id, name, name_key, description, item_type) VALUES (?, ?, ?, ?, ?)',
+                       (USER_ID, name, db.name_key(name), 'benchmark', ItemType.MISC.name))
+        item_id = cursor.lastrowid
+        cursor.executemany('INSERT INTO item_stat (item_id, stat_name, stat_desc, value) VALUES (?, ?, ?, ?)',
+                           ((item_id, skills[(i + j) % len(skills)].name, 'benchmark', 1) for j in range(effects)))
+        cursor.execute('INSERT INTO inventory (character_id, item_id, quantity, equipped) VALUES (?, ?, 1, 0)',
+                       (character_id, item_id))
+    cursor.close()
+    db.commit()
+    return character_id
+
+def load_one_by_one(character_id: int) -> list:
+    cursor = db.conn.cursor()
+    cursor.execute('SELECT item_id, quantity FROM inventory WHERE character_id = ?', (character_id,))
+    inventory = []
+    for item_id, quantity in cursor.fetchall():
+        cursor.execute(('SELECT id, user_id, name, description, image_url, slot, item_type, duration '
+                        'FROM item WHERE id = ?'), (item_id,))
+        item = construct_item(cursor.fetchone())
+        cursor.execute('SELECT * FROM item_stat WHERE item_id = ?', (item_id,))
+        item.effects.extend(construct_itemstat(row) for row in cursor.fetchall())
+        inventory.append((item, quantity))
+    cursor.close()
+    return inventory
+
+def count_queries(func, *args) -> tuple[float, int]:
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    db.conn.set_trace_callback(None)
+    return elapsed, len(statements)
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, nargs='+', default=[10, 1_000, 5_000])
+    parser.add_argument('--effects', type=int, default=3, help='item_stat rows per item.')
+    args = parser.parse_args()
+
+    migrations.migrate()
+
+    for i, entries in enumerate(args.entries):
+        character_id = seed(f'Harry {i}', entries, args.effects)
+        for label, func in (('one by one', load_one_by_one), ('batched', itemsvc.get_inventory_by_character_id)):
+            elapsed, queries = count_queries(func, character_id)
+            print(f'{entries:>6} entries, {label:>10}: {elapsed * 1000:8.2f} ms, {queries} queries')
+
+if __name__ == '__main__':
+    main()
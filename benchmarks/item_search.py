@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# Times the item name autocomplete searches against a large synthetic catalog.
+# Run from the repository root: python -m benchmarks.item_search --items 1000000
+
+import argparse
+import random
+import time
+
+from benchmarks.services import WORDS
+from models.item_type import ItemType
+from services import itemsvc
+from util import db, migrations
+
+def seed(items: int, users: int) -> None:
+    rng = random.Random(0)
+    cursor = db.conn.cursor()
+    names = (f'{" ".join(rng.choices(WORDS, k=3))} {i}' for i in range(items))
+    cursor.executemany('INSERT INTO item (user_id, name, name_key, description, item_type) VALUES (?, ?, ?, ?, ?)',
+                       ((rng.randrange(users), name, db.name_key(name), '', ItemType.MISC.name) for name in names))
+    cursor.close()
+    db.commit()
+
+def time_search(func, *args, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    migrations.migrate()
+
+    start = time.perf_counter()
+    seed(args.items, args.users)
+    print(f'seeded {args.items:,} items in {time.perf_counter() - start:.1f}s')
+
+    # 'q' and 'zq' appear in no name
+    for query in ('b', 're', 'q', 'zq', 'red', 'necktie', 'acket', 'tie 12', 'zzz'):
+        everyone = time_search(itemsvc.roughly_search_all_item_names, query, repeat=args.repeat)
+        owned = time_search(itemsvc.roughly_search_item_names_by_user, query, 1, repeat=args.repeat)
+        print(f'{query!r:>10}: all {everyone * 1e6:9.1f} us, by user {owned * 1e6:9.1f} us')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+# Times success probability lookups, alone and for every skill on a cached character sheet.
+# Run from the repository root: python -m benchmarks.odds
+
+import argparse
+import time
+
+from models.difficulty import Difficulty
+from models.skill import Skill
+from services import charactersvc, rollsvc
+from util import migrations
+
+USER_ID = 1
+
+def time_per_call(func, *args, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=100_000)
+    args = parser.parse_args()
+
+    migrations.migrate()
+    charactersvc.create_character(USER_ID, 'Harry')
+    for skill in Skill:
+        charactersvc.set_skill(USER_ID, skill.name, skill.value % 5)
+    charactersvc.get_active_character_by_user_id(USER_ID)
+
+    single = time_per_call(rollsvc.success_probability, 4, Difficulty.FORMIDABLE.value, 1, repeat=args.repeat)
+    one_skill = time_per_call(rollsvc.get_odds, USER_ID, Skill.LOGIC, Difficulty.MEDIUM, repeat=args.repeat)
+    sheet = time_per_call(rollsvc.get_all_odds, USER_ID, Difficulty.MEDIUM, repeat=args.repeat // 10)
+    print(f'success_probability: {single * 1e6:.2f} us')
+    print(f'get_odds (cached character): {one_skill * 1e6:.2f} us')
+    print(f'get_all_odds, {len(Skill)} skills: {sheet * 1e6:.2f} us')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Runs every service function against a small seeded database, records the statements they execute
+# and checks with EXPLAIN QUERY PLAN that none of them scans a whole table. Exits with status 1 if one does.
+# Run from the repository root: python -m benchmarks.query_plans
+
+import argparse
+import io
+import random
+import re
+import sys
+
+from benchmarks.services import seed
+from models.difficulty import Difficulty
+from models.item_type import ItemType
+from models.skill import Skill
+from models.slot import Slot
+from services import charactersvc, itemsvc, rollsvc
+from util import db, migrations
+
+# Statements allowed to scan, by a pattern of their text, and why
+ALLOWED_SCANS = {
+    r'FROM item LEFT JOIN item_stat .* ORDER BY item\.id': 'Catalog export reads every item',
+}
+
+def exercise(catalog: list[tuple[int, str]]) -> None:
+    owner, name = catalog[0]
+    charactersvc.create_character(owner, 'Query Plan')
+    character = charactersvc.get_active_character_by_user_id(owner)
+    charactersvc.get_character_by_id(character.db_id)
+    charactersvc.get_active_characters_by_user_ids([1, 2, 3])
+    charactersvc.get_characters_owned_by_user(owner)
+    charactersvc.set_attribute(owner, 'Physique', 3)
+    charactersvc.set_skill(owner, 'Electrochemistry', 4)
+    charactersvc.set_stats(owner, 'INT 3 PSY 2 logic 2 empathy 1')
+    charactersvc.db_activate_character(owner, character.db_id)
+    charactersvc.activate_character(owner, 'query plan')
+    charactersvc.find_character_by_name('character 5', owner, 5)
+    charactersvc.find_character_by_name('character 5', owner)
+    charactersvc.search_character_names('char', owner, 5)
+    charactersvc.search_character_names('', owner)
+    charactersvc.search_own_character_names('q', owner)
+
+    itemsvc.create_item(owner, 'query plan hat', 'A hat', ItemType.WEARABLE)
+    item = itemsvc.find_item_by_name(name)
+    itemsvc.get_item_by_id(item.db_id + 1)
+    itemsvc.count_inspection(item)
+    itemsvc.flush_inspections()
+    itemsvc.preload_items(10)
+    for text in ('re', 'red', 'tie ped', name[:4]):
+        itemsvc.roughly_search_all_item_names(text)
+        itemsvc.roughly_search_item_names_by_user(text, owner)
+    itemsvc.get_items_owned_by_user(owner)
+    itemsvc.get_character_inventory(owner)
+    itemsvc.set_attribute(owner, name, 'Psyche', 2, 'query plan')
+    itemsvc.set_skill(owner, name, 'Empathy', 1, 'query plan')
+    itemsvc.unequip_item(owner, Slot.HAT)
+    itemsvc.import_items(owner, itemsvc.parse_catalog(b'name,type,stat,value\nquery plan boots,wearable,Savoir Faire,1\n', 'csv'))
+    itemsvc.export_items(io.StringIO(), 'json')
+
+    rollsvc.roll_skill(owner, Skill.LOGIC, Difficulty.MEDIUM)
+    rollsvc.roll_skill_for_users([owner, 1, 2], Skill.LOGIC, Difficulty.MEDIUM)
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--verbose', action='store_true', help='Print the plan of every statement.')
+    args = parser.parse_args()
+
+    migrations.migrate()
+    catalog = seed(random.Random(0), users=200, characters=400, items=2_000, effects=2, stats=4, inventory=5)
+
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    exercise(catalog)
+    db.conn.set_trace_callback(None)
+
+    failures = 0
+    seen = set()
+    for statement in statements:
+        text = ' '.join(statement.split())
+        # Statements run by triggers are reported with a leading comment, and are checked as part of their statement
+        if text in seen or not re.match(r'(SELECT|INSERT|UPDATE|DELETE)\b', text, re.IGNORECASE):
+            continue
+        seen.add(text)
+
+        # Single-row inserts never scan. Their plans only show SQLite's foreign key bookkeeping for child tables,
+        # which runs only while a violation is outstanding.
+        if re.match(r'INSERT\b.*\bVALUES\b', text, re.IGNORECASE) and ' SELECT ' not in text.upper():
+            continue
+
+        plan = [row[3] for row in db.conn.execute('EXPLAIN QUERY PLAN ' + statement)]
+        # Scans of a subquery's rows, "SCAN (subquery-1)", read what an indexed search produced and are fine
+        scans = [x for x in plan if x.startswith('SCAN ') and not x.startswith('SCAN (')
+                 and 'VIRTUAL TABLE' not in x and 'CONSTANT ROW' not in x]
+        allowed = next((reason for pattern, reason in ALLOWED_SCANS.items() if re.search(pattern, text)), None)
+
+        if scans and allowed is None:
+            failures += 1
+            print(f'FULL SCAN: {text}')
+            for line in plan:
+                print(f'    {line}')
+        elif args.verbose:
+            print(f'{"allowed scan" if scans else "ok"}: {text}' + (f' ({allowed})' if scans else ''))
+            for line in plan:
+                print(f'    {line}')
+
+    print(f'{len(seen)} statements checked, {failures} scanning a whole table')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
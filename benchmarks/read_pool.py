@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Measures throughput of a mix of reads and writes from the event loop as the number of reader threads changes.
+# Reads go through db.read() and writes through db.run(), as the cogs do. 0 readers sends everything to the worker.
+# Run from the repository root: python -m benchmarks.read_pool
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.services import WORDS, seed
+from models.skill import Skill
+from services import charactersvc, itemsvc
+from util import db, migrations
+
+def percentile(ordered: list[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] if ordered else 0.0
+
+async def client(rng: random.Random, deadline: float, write_share: float, users: int,
+                 catalog: list[tuple[int, str]], reads: list[float], writes: list[float]) -> None:
+    skills = [x.name for x in Skill]
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if rng.random() < write_share:
+            await db.run(charactersvc.set_skill, rng.randrange(users), rng.choice(skills), rng.randrange(1, 7))
+            writes.append(time.perf_counter() - start)
+            continue
+
+        kind = rng.randrange(3)
+        if kind == 0:
+            await db.read(itemsvc.roughly_search_all_item_names, ' '.join(rng.choices(WORDS, k=2))[:rng.randrange(3, 10)])
+        elif kind == 1:
+            await db.read(itemsvc.find_item_by_name, rng.choice(catalog)[1])
+        else:
+            await db.read(itemsvc.get_character_inventory, rng.randrange(users))
+        reads.append(time.perf_counter() - start)
+
+async def run(readers: int, clients: int, seconds: float, write_share: float, users: int, catalog: list[tuple[int, str]]) -> dict:
+    db.READERS = readers
+    db.open_database(db.DATABASE_PATH)
+
+    reads, writes = [], []
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(client(random.Random(i), deadline, write_share, users, catalog, reads, writes) for i in range(clients)))
+    reads.sort()
+    writes.sort()
+    return {
+        'reads_per_sec': len(reads) / seconds,
+        'writes_per_sec': len(writes) / seconds,
+        'read_p50_ms': percentile(reads, 50) * 1000,
+        'read_p99_ms': percentile(reads, 99) * 1000,
+        'write_p50_ms': percentile(writes, 50) * 1000,
+        'write_p99_ms': percentile(writes, 99) * 1000,
+    }
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, nargs='+', default=[0, 1, 2, 4, 8])
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent requests from the event loop.')
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--write-share', type=float, default=0.2, help='Fraction of requests that write.')
+    parser.add_argument('--users', type=int, default=5_000)
+    parser.add_argument('--items', type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db.open_database(os.path.join(directory, 'bench.db'))
+        migrations.migrate()
+        catalog = seed(random.Random(0), args.users, args.users * 2, args.items, effects=2, stats=4, inventory=5)
+
+        for readers in args.readers:
+            result = await run(readers, args.clients, args.seconds, args.write_share, args.users, catalog)
+            print(f'{readers} readers: ' + ', '.join(f'{k}={v:,.2f}' for k, v in result.items()))
+
+        db.app_exit()
+
+if __name__ == '__main__':
+    asyncio.run(main())
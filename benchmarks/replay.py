@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+# Replays a mix of interactions through the real cogs with stand-ins for the Discord objects,
+# so embed building, choice construction and responses are measured along with the services.
+# Nothing connects to Discord. Run from the repository root: python -m benchmarks.replay
+#
+# --record writes the generated interactions as JSON lines and --replay reads them back, so the same
+# mix can be run against two versions of the bot. With --rate, interactions arrive on a fixed
+# schedule and latency counts from the scheduled arrival, so time spent waiting for a free slot is included.
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+import discord
+from discord.ext import commands
+
+from benchmarks.services import WORDS, seed
+from models.difficulty import Difficulty
+from models.skill import Skill
+import models.stats
+from util import migrations
+
+class FakeMember:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+        self.name = f'user{user_id}'
+        self.display_name = self.name
+        self.mention = f'<@{user_id}>'
+        self.color = discord.Colour(user_id % 0xffffff)
+        self.display_avatar = f'https://cdn.discordapp.com/embed/avatars/{user_id % 6}.png'
+
+class FakeResponse:
+    # Serializes what would be sent, as discord.py does before making the request
+    def __init__(self) -> None:
+        self.payload = None
+
+    def is_done(self) -> bool:
+        return self.payload is not None
+
+    async def send_message(self, content: Optional[str] = None, *, embed: Optional[discord.Embed] = None, **kwargs) -> None:
+        self.payload = { 'content': content, 'embeds': [embed.to_dict()] if embed else [] }
+
+    async def autocomplete(self, choices: list[discord.app_commands.Choice]) -> None:
+        self.payload = { 'choices': [x.to_dict() for x in choices] }
+
+    async def defer(self, **kwargs) -> None:
+        self.payload = {}
+
+class FakeInteraction:
+    def __init__(self, user: FakeMember, namespace: SimpleNamespace) -> None:
+        self.user = user
+        self.namespace = namespace
+        self.response = FakeResponse()
+        self.guild = None
+        self.guild_id = None
+
+def generate(rng: random.Random, count: int, users: int, catalog: list[tuple[int, str]]) -> list[dict]:
+    skill_names = [x.name for x in Skill]
+    pretty_skill_names = [models.stats.get_pretty_name(x) for x in Skill]
+    difficulties = [x.name for x in Difficulty]
+
+    def user() -> int:
+        return rng.randrange(users)
+
+    def typed(text: str) -> str:
+        # What has been typed so far when the autocomplete fires
+        return text[:rng.randrange(len(text) + 1)]
+
+    def sheet() -> dict:
+        return { 'command': 'character sheet', 'user': user(),
+                 'options': { 'other_user': user() if rng.random() < 0.3 else None, 'character_name': None } }
+
+    def set_character_skill() -> dict:
+        return { 'command': 'character setskill', 'user': user(),
+                 'options': { 'skill_name': rng.choice(pretty_skill_names), 'value': rng.randrange(1, 7) } }
+
+    def sheet_by_name() -> dict:
+        # The first character of every user is named after the user, see seed(). Interactions come from DMs,
+        # so only the user's own characters can be found.
+        user_id = user()
+        return { 'command': 'character sheet', 'user': user_id,
+                 'options': { 'other_user': None, 'character_name': f'character {user_id}' } }
+
+    def character_name_autocomplete() -> dict:
+        user_id = user()
+        return { 'autocomplete': 'character sheet', 'option': 'character_name', 'user': user_id,
+                 'options': { 'other_user': None, 'character_name': typed(f'Character {user_id}') } }
+
+    def set_character_stats() -> dict:
+        names = rng.sample(pretty_skill_names, 4) + ['INT', 'PSY', 'FYS', 'MOT']
+        return { 'command': 'character setstats', 'user': user(),
+                 'options': { 'stats': ' '.join(f'{name} {rng.randrange(1, 7)}' for name in names) } }
+
+    def list_characters() -> dict:
+        return { 'command': 'character list', 'user': user(), 'options': { 'other_user': None } }
+
+    def inspect() -> dict:
+        return { 'command': 'item inspect', 'user': user(), 'options': { 'item_name': rng.choice(catalog)[1] } }
+
+    def set_item_skill() -> dict:
+        owner, name = rng.choice(catalog)
+        return { 'command': 'item setskill', 'user': owner,
+                 'options': { 'item_name': name, 'skill_name': rng.choice(skill_names),
+                              'value': rng.randrange(1, 3), 'stat_description': 'replay' } }
+
+    def roll_check() -> dict:
+        return { 'command': 'roll check', 'user': user(),
+                 'options': { 'skill': rng.choice(skill_names), 'difficulty': rng.choice(difficulties),
+                              'body': None, 'modifier': None } }
+
+    def roll_odds() -> dict:
+        return { 'command': 'roll odds', 'user': user(),
+                 'options': { 'skill': rng.choice(skill_names), 'difficulty': None, 'modifier': None } }
+
+    def roll_group() -> dict:
+        return { 'command': 'roll group', 'user': user(),
+                 'options': { 'skill': rng.choice(skill_names), 'difficulty': rng.choice(difficulties),
+                              'players': ' '.join(f'<@{user()}>' for _ in range(4)) } }
+
+    def skill_autocomplete() -> dict:
+        return { 'autocomplete': 'roll check', 'option': 'skill', 'user': user(),
+                 'options': { 'skill': typed(rng.choice(pretty_skill_names)), 'difficulty': rng.choice(difficulties), 'modifier': None } }
+
+    def item_autocomplete() -> dict:
+        return { 'autocomplete': 'item inspect', 'option': 'item_name', 'user': user(),
+                 'options': { 'item_name': typed(' '.join(rng.choices(WORDS, k=2))) } }
+
+    def owned_item_autocomplete() -> dict:
+        owner, name = rng.choice(catalog)
+        return { 'autocomplete': 'item setskill', 'option': 'item_name', 'user': owner,
+                 'options': { 'item_name': typed(name) } }
+
+    # Relative frequency of each kind of interaction
+    mix = {
+        sheet: 20, roll_check: 20, skill_autocomplete: 15, item_autocomplete: 10, owned_item_autocomplete: 5,
+        inspect: 10, roll_odds: 5, list_characters: 5, set_character_skill: 5, set_item_skill: 3, roll_group: 2,
+        set_character_stats: 1, sheet_by_name: 3, character_name_autocomplete: 3,
+    }
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [kind() for kind in kinds]
+
+class Replayer:
+    def __init__(self, bot: commands.Bot) -> None:
+        self.commands = {}
+        for cog in bot.cogs.values():
+            for command in cog.walk_app_commands():
+                if isinstance(command, discord.app_commands.Command):
+                    self.commands[command.qualified_name] = command
+
+    async def dispatch(self, event: dict) -> None:
+        name = event.get('command') or event['autocomplete']
+        command = self.commands[name]
+        options = dict(event['options'])
+        for param in command._params.values():
+            if param.type is discord.AppCommandOptionType.user and options.get(param.name) is not None:
+                options[param.name] = FakeMember(options[param.name])
+
+        interaction = FakeInteraction(FakeMember(event['user']), SimpleNamespace(**options))
+        if 'autocomplete' in event:
+            await command._invoke_autocomplete(interaction, event['option'], interaction.namespace)
+        else:
+            await command._do_call(interaction, options)
+
+def percentile(ordered: list[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] if ordered else 0.0
+
+def summarize(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p95_ms': percentile(ordered, 95) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': ordered[-1] * 1000 if ordered else 0.0,
+    }
+
+async def probe_loop_lag(stop: asyncio.Event, samples: list[float], interval: float) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+async def replay(replayer: Replayer, events: list[dict], concurrency: int, rate: float) -> dict:
+    latencies = {}
+    errors = {}
+    lag = []
+    slots = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(stop, lag, 0.001))
+
+    async def run_one(event: dict, arrival: float) -> None:
+        kind = event.get('command') or f'{event["autocomplete"]} [{event["option"]}]'
+        async with slots:
+            if not rate:
+                arrival = time.perf_counter()
+            try:
+                await replayer.dispatch(event)
+            except Exception:
+                errors[kind] = errors.get(kind, 0) + 1
+            latencies.setdefault(kind, []).append(time.perf_counter() - arrival)
+
+    start = time.perf_counter()
+    tasks = []
+    for i, event in enumerate(events):
+        arrival = start + i / rate if rate else start
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run_one(event, arrival)))
+        if not rate and len(tasks) >= concurrency * 4:
+            # Keep a bounded number of tasks waiting on the semaphore
+            await asyncio.gather(*tasks)
+            tasks.clear()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe
+
+    return {
+        'elapsed_s': elapsed,
+        'throughput_per_sec': len(events) / elapsed,
+        'errors': errors,
+        'overall': summarize([x for samples in latencies.values() for x in samples]),
+        'loop_lag': summarize(lag),
+        'interactions': { kind: summarize(samples) for kind, samples in sorted(latencies.items()) },
+    }
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--characters', type=int, default=2_000)
+    parser.add_argument('--items', type=int, default=10_000)
+    parser.add_argument('--interactions', type=int, default=5_000)
+    parser.add_argument('--concurrency', type=int, default=16, help='Interactions handled at the same time.')
+    parser.add_argument('--rate', type=float, default=0, help='Arrivals per second. 0 sends them as fast as they are handled.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--record', help='Write the generated interactions to this file.')
+    parser.add_argument('--replay', help='Replay interactions recorded with --record instead of generating them.')
+    parser.add_argument('--output', help='Also write the results to this file.')
+    args = parser.parse_args()
+    args.characters = max(args.characters, args.users)
+
+    migrations.migrate()
+    rng = random.Random(args.seed)
+    catalog = seed(rng, args.users, args.characters, args.items, effects=2, stats=4, inventory=5)
+
+    if args.replay:
+        with open(args.replay, encoding='utf-8') as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    else:
+        events = generate(rng, args.interactions, args.users, catalog)
+    if args.record:
+        with open(args.record, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(x) + '\n' for x in events)
+
+    bot = commands.Bot(command_prefix=commands.when_mentioned, intents=discord.Intents.default())
+    for extension in ('cogs.charactercmds', 'cogs.rollcmds', 'cogs.itemcmds'):
+        await bot.load_extension(extension)
+
+    results = {
+        'config': { k: v for k, v in vars(args).items() if k not in ('record', 'output') },
+        **await replay(Replayer(bot), events, args.concurrency, args.rate),
+    }
+    await bot.close()
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+if __name__ == '__main__':
+    asyncio.run(main())
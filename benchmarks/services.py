@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# Seeds a synthetic dataset and times the main service functions, printing the results as JSON
+# so runs can be compared. The defaults are a tenth of a large deployment; for the full size run
+# python -m benchmarks.services --users 100000 --characters 500000 --items 1000000 --output before.json
+# Run from the repository root: python -m benchmarks.services
+
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import sys
+import time
+
+from models.attribute import Attribute
+from models.item_type import ItemType
+from models.skill import Skill
+from models.slot import Slot
+from services import charactersvc, itemsvc
+from util import db, migrations
+
+WORDS = ['bottle', 'tie', 'jacket', 'commodore', 'red', 'boot', 'gun', 'horrific', 'necktie', 'pants',
+         'revachol', 'kineema', 'doomed', 'ledger', 'pill', 'speed', 'faln', 'sunglasses', 'aerostatic', 'pale']
+
+# Characters are spread over this many guilds
+GUILDS = 50
+
+def seed(rng: random.Random, users: int, characters: int, items: int, effects: int, stats: int, inventory: int) -> list[tuple[int, str]]:
+    # Returns (owner, name) of every item
+    attributes = list(Attribute)
+    skills = list(Skill)
+    slots = list(Slot)
+    cursor = db.conn.cursor()
+
+    # Every user gets one character, the rest are spread randomly. A user's first character is active.
+    owners = list(range(users)) + [rng.randrange(users) for _ in range(characters - users)]
+    cursor.executemany('INSERT INTO character (id, user_id, name, name_key, guild_id, health, morale) VALUES (?, ?, ?, ?, ?, 10, 10)',
+                       ((i + 1, owner, f'Character {i}', f'character {i}', owner % GUILDS + 1) for i, owner in enumerate(owners)))
+    cursor.executemany('INSERT INTO active_character (user_id, character_id) VALUES (?, ?)',
+                       ((user_id, user_id + 1) for user_id in range(users)))
+    cursor.executemany('INSERT INTO attribute (character_id, attribute_name, value) VALUES (?, ?, ?)',
+                       ((i, x.name, rng.randrange(1, 7)) for i in range(1, characters + 1)
+                        for x in rng.sample(attributes, min(stats, len(attributes)))))
+    cursor.executemany('INSERT INTO skill (character_id, skill_name, value) VALUES (?, ?, ?)',
+                       ((i, x.name, rng.randrange(1, 7)) for i in range(1, characters + 1)
+                        for x in rng.sample(skills, min(stats, len(skills)))))
+
+    # Half of the items can be worn
+    catalog = [(rng.randrange(users), f'{" ".join(rng.choices(WORDS, k=3))} {i}') for i in range(items)]
+    cursor.executemany(('INSERT INTO item (id, user_id, name, name_key, description, slot, item_type) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)'),
+                       ((i + 1, owner, name, db.name_key(name), 'benchmark',
+                         slots[i % len(slots)].name if i % 2 == 0 else None,
+                         ItemType.WEARABLE.name if i % 2 == 0 else ItemType.MISC.name)
+                        for i, (owner, name) in enumerate(catalog)))
+    cursor.executemany('INSERT INTO item_stat (item_id, stat_name, stat_desc, value) VALUES (?, ?, ?, ?)',
+                       ((i, x.name, 'benchmark', rng.randrange(-2, 3) or 1) for i in range(1, items + 1)
+                        for x in rng.sample(skills, effects)))
+
+    # The first item in each character's inventory is worn, if it can be
+    cursor.executemany('INSERT OR IGNORE INTO inventory (character_id, item_id, quantity, equipped) VALUES (?, ?, ?, ?)',
+                       ((i, item_id, rng.randrange(1, 4), j == 0 and item_id % 2 == 1)
+                        for i in range(1, characters + 1)
+                        for j, item_id in enumerate(rng.sample(range(1, items + 1), inventory))))
+    cursor.close()
+    db.conn.commit()
+    return catalog
+
+def search_text(rng: random.Random, catalog: list[tuple[int, str]]) -> str:
+    # A prefix or a fragment from the middle of an existing name, like a user typing in autocomplete
+    name = rng.choice(catalog)[1]
+    length = rng.randrange(2, 8)
+    start = 0 if rng.random() < 0.5 else rng.randrange(max(1, len(name) - length))
+    return name[start:start + length]
+
+def measure(func, args: list[tuple]) -> dict:
+    samples = []
+    for x in args:
+        start = time.perf_counter()
+        func(*x)
+        samples.append(time.perf_counter() - start)
+
+    samples.sort()
+    def at(pct: float) -> float:
+        return samples[min(len(samples) - 1, int(pct / 100 * len(samples)))] * 1e6
+
+    return {
+        'ops': len(samples),
+        'ops_per_sec': len(samples) / sum(samples),
+        'p50_us': at(50),
+        'p95_us': at(95),
+        'p99_us': at(99),
+        'max_us': samples[-1] * 1e6,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--characters', type=int, default=50_000, help='At least one per user.')
+    parser.add_argument('--items', type=int, default=100_000)
+    parser.add_argument('--effects', type=int, default=2, help='item_stat rows per item.')
+    parser.add_argument('--stats', type=int, default=4, help='Attributes and skills stored per character.')
+    parser.add_argument('--inventory', type=int, default=5, help='Items in each inventory.')
+    parser.add_argument('--ops', type=int, default=2_000, help='Calls timed per function.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Also write the results to this file.')
+    args = parser.parse_args()
+
+    migrations.migrate()
+    args.characters = max(args.characters, args.users)
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    catalog = seed(rng, args.users, args.characters, args.items, args.effects, args.stats, args.inventory)
+    seed_time = time.perf_counter() - start
+
+    def users() -> list[tuple]:
+        return [(rng.randrange(args.users),) for _ in range(args.ops)]
+
+    def owned_items() -> list[tuple]:
+        return [rng.choice(catalog) for _ in range(args.ops)]
+
+    attributes = [x.name for x in Attribute]
+    skills = [x.name for x in Skill]
+    cases = {
+        'get_active_character_by_user_id': (charactersvc.get_active_character_by_user_id, users()),
+        'find_item_by_name': (itemsvc.find_item_by_name, [(name,) for _, name in owned_items()]),
+        'roughly_search_all_item_names': (itemsvc.roughly_search_all_item_names,
+                                          [(search_text(rng, catalog),) for _ in range(args.ops)]),
+        'roughly_search_item_names_by_user': (itemsvc.roughly_search_item_names_by_user,
+                                              [(search_text(rng, catalog), rng.randrange(args.users)) for _ in range(args.ops)]),
+        'get_character_inventory': (itemsvc.get_character_inventory, users()),
+        'charactersvc.set_attribute': (charactersvc.set_attribute,
+                                       [(user_id, rng.choice(attributes), rng.randrange(1, 7)) for user_id, in users()]),
+        'charactersvc.set_skill': (charactersvc.set_skill,
+                                   [(user_id, rng.choice(skills), rng.randrange(1, 7)) for user_id, in users()]),
+        'itemsvc.set_attribute': (itemsvc.set_attribute,
+                                  [(owner, name, rng.choice(attributes), rng.randrange(1, 3), 'benchmark') for owner, name in owned_items()]),
+        'itemsvc.set_skill': (itemsvc.set_skill,
+                              [(owner, name, rng.choice(skills), rng.randrange(1, 3), 'benchmark') for owner, name in owned_items()]),
+    }
+
+    results = {
+        'config': { k: v for k, v in vars(args).items() if k != 'output' },
+        'environment': {
+            'python': sys.version.split()[0],
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'database': db.DATABASE_PATH,
+            'group_commit_ms': db.GROUP_COMMIT_MS,
+        },
+        'seed_s': seed_time,
+        'results': { name: measure(func, calls) for name, (func, calls) in cases.items() },
+    }
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+if __name__ == '__main__':
+    main()
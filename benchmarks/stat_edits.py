@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Measures /character setskill and setattribute style edits sent from the event loop, written right away
+# and held back for different windows, and how many rows and transactions each setting writes.
+# Run from the repository root: python -m benchmarks.stat_edits
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.services import seed
+from models.attribute import Attribute
+from models.skill import Skill
+from services import charactersvc
+from util import db, migrations
+
+async def run(delay_ms: float, edits: int, clients: int, users: int, hot_users: int) -> dict:
+    charactersvc.STAT_WRITE_DELAY_MS = delay_ms
+    statements = []
+    db.set_trace_callback(statements.append)
+
+    # Most edits come from a few users adjusting the same stats, as during character creation
+    stat_names = [('attribute', x.name) for x in list(Attribute)[:2]] + [('skill', x.name) for x in list(Skill)[:4]]
+    rng = random.Random(0)
+    queue = asyncio.Queue()
+    for _ in range(edits):
+        user_id = rng.randrange(hot_users) if rng.random() < 0.9 else rng.randrange(users)
+        queue.put_nowait((user_id, rng.choice(stat_names), rng.randrange(1, 7)))
+
+    async def client() -> None:
+        while not queue.empty():
+            user_id, (kind, name), value = queue.get_nowait()
+            func = charactersvc.set_attribute if kind == 'attribute' else charactersvc.set_skill
+            await db.run(func, user_id, name, value)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    await db.run(charactersvc.flush_stat_edits)
+    # Let the group commit of the last edits run
+    await asyncio.sleep(max(0.05, db.GROUP_COMMIT_MS / 500))
+    db.set_trace_callback(None)
+
+    return {
+        'edits_per_sec': edits / elapsed,
+        'rows_written': sum(1 for x in statements if x.startswith(('INSERT INTO attribute', 'INSERT INTO skill'))),
+        'commits': sum(1 for x in statements if x == 'COMMIT'),
+    }
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--delays', type=float, nargs='+', default=[0, 100, 1000], help='Values of BALLROOM_STAT_WRITE_DELAY_MS.')
+    parser.add_argument('--edits', type=int, default=5_000)
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent edits from the event loop.')
+    parser.add_argument('--users', type=int, default=5_000)
+    parser.add_argument('--hot-users', type=int, default=20, help='Users making most of the edits.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db.open_database(os.path.join(directory, 'bench.db'))
+        migrations.migrate()
+        seed(random.Random(0), args.users, args.users, 1_000, effects=2, stats=4, inventory=2)
+
+        for delay in args.delays:
+            result = await run(delay, args.edits, args.clients, args.users, args.hot_users)
+            print(f'{delay:g} ms: ' + ', '.join(f'{k}={v:,.2f}' for k, v in result.items()))
+
+        db.app_exit()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import tempfile
+from typing import Optional
+
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+
+from services import charactersvc, itemsvc
+from util import db, metrics
+from util.errors import ItemException
+
+# Item import errors listed in the reply, the rest are only counted
+MAX_LISTED_ERRORS = 15
+
+async def setup(bot):
+    await bot.add_cog(AdminCog(bot))
+
+def metrics_snapshot() -> dict:
+    return { **metrics.snapshot(), 'caches': { **charactersvc.cache_stats(), **itemsvc.cache_stats() } }
+
+def format_metrics(data: dict) -> str:
+    # Slowest handlers (by total time spent) first, trimmed to fit in a message
+    handlers = sorted(data['handlers'].items(), key=lambda x: x[1]['total_ms'], reverse=True)
+    lines = [f'{"handler":<32} {"calls":>6} {"err":>4} {"p50":>7} {"p95":>7} {"p99":>7} {"q/call":>6} {"qms":>6}']
+    for name, x in handlers:
+        lines.append(f'{name[:32]:<32} {x["calls"]:>6} {x["errors"]:>4} {x["p50_ms"]:>7.1f} {x["p95_ms"]:>7.1f} '
+                     f'{x["p99_ms"]:>7.1f} {x["queries_per_call"]:>6.1f} {x["query_ms_per_call"]:>6.1f}')
+    lines.append(f'background queries: {data["background"]["queries"]} ({data["background"]["query_ms"]:.1f} ms)')
+    for name, x in data['caches'].items():
+        if isinstance(x, dict):
+            lines.append(f'{name} cache: {x["size"]}/{x["maxsize"]}, hit rate {x["hit_rate"]:.1%}')
+        else:
+            lines.append(f'{name}: {x}')
+
+    text = []
+    length = 0
+    for line in lines:
+        length += len(line) + 1
+        if length > 1900:
+            break
+        text.append(line)
+    return '```\n' + '\n'.join(text) + '\n```'
+
+def import_catalog(user_id: int, data: bytes, fmt: str) -> tuple[int, list[str]]:
+    return itemsvc.import_items(user_id, itemsvc.parse_catalog(data, fmt))
+
+def export_catalog(path: str, fmt: str) -> int:
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        return itemsvc.export_items(f, fmt)
+
+class AdminCog(commands.GroupCog, name='admin', description='Bot owner commands'):
+    def __init__(self, bot: commands.Bot) -> None:
+        self.bot = bot
+
+    async def cog_load(self) -> None:
+        if metrics.METRICS_FILE:
+            self.flush_metrics.change_interval(seconds=metrics.METRICS_INTERVAL)
+            self.flush_metrics.start()
+
+    async def cog_unload(self) -> None:
+        self.flush_metrics.cancel()
+
+    @tasks.loop(seconds=60)
+    async def flush_metrics(self) -> None:
+        await asyncio.to_thread(metrics.write, metrics.METRICS_FILE, metrics_snapshot())
+
+    async def check_owner(self, interaction: discord.Interaction) -> bool:
+        if await self.bot.is_owner(interaction.user):
+            return True
+        await interaction.response.send_message('Only the bot owner can use this command.', ephemeral=True)
+        return False
+
+    @app_commands.command(name="importitems", description="Adds every item in a JSON or CSV catalog file.")
+    @app_commands.describe(catalog="A JSON or CSV file in the format written by /admin exportitems.")
+    async def import_items(self, interaction: discord.Interaction, catalog: discord.Attachment) -> None:
+        if not await self.check_owner(interaction):
+            return
+
+        fmt = os.path.splitext(catalog.filename)[1].lstrip('.').lower()
+        await interaction.response.defer(ephemeral=True)
+        try:
+            imported, errors = await db.run(import_catalog, interaction.user.id, await catalog.read(), fmt)
+        except ItemException as e:
+            await interaction.followup.send(f'Failed to import items. {e}', ephemeral=True)
+            return
+
+        lines = [f'Imported {imported} items.']
+        if errors:
+            lines.append(f'Skipped {len(errors)} rows:')
+            lines.extend(errors[:MAX_LISTED_ERRORS])
+            if len(errors) > MAX_LISTED_ERRORS:
+                lines.append(f'...and {len(errors) - MAX_LISTED_ERRORS} more.')
+        await interaction.followup.send('\n'.join(lines)[:2000], ephemeral=True)
+
+    @app_commands.command(name="exportitems", description="Exports every item and its effects as a file.")
+    @app_commands.describe(file_format="JSON (default) or CSV.")
+    @app_commands.choices(file_format=[app_commands.Choice(name='JSON', value='json'), app_commands.Choice(name='CSV', value='csv')])
+    async def export_items(self, interaction: discord.Interaction, file_format: Optional[str]) -> None:
+        if not await self.check_owner(interaction):
+            return
+
+        fmt = file_format or 'json'
+        await interaction.response.defer(ephemeral=True)
+        fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+        os.close(fd)
+        try:
+            count = await db.read(export_catalog, path, fmt)
+            await interaction.followup.send(f'Exported {count} items.', file=discord.File(path, filename=f'items.{fmt}'), ephemeral=True)
+        finally:
+            os.remove(path)
+
+    @app_commands.command(name="metrics", description="Shows command latencies and query counts.")
+    async def show_metrics(self, interaction: discord.Interaction) -> None:
+        if not await self.check_owner(interaction):
+            return
+
+        await interaction.response.send_message(format_metrics(metrics_snapshot()), ephemeral=True)
@@ -7,11 +7,19 @@ from models.attribute import Attribute
 import models.stats
 from models.character import Character
 
+from cogs import choices
 from services import charactersvc
+from util import db, metrics
+from util.cache import LRUCache
 from util.errors import CharacterException
 
+# Rendered sheets by (character id, character version, embed color). Only used on the event loop.
+_sheet_cache = LRUCache(1024)
+
 async def setup(bot):
-    await bot.add_cog(CharacterCog(bot))
+    cog = CharacterCog(bot)
+    metrics.instrument_cog(cog)
+    await bot.add_cog(cog)
 
 class CharacterCog(commands.GroupCog, name='character', description='Character commands'):
     def __init__(self, bot: commands.Bot) -> None:
@@ -20,7 +28,7 @@ class CharacterCog(commands.GroupCog, name='character', description='Character c
         self.bot.tree.add_command(self.user_menu)
 
     async def sheet_user(self, inter: discord.Interaction, member: discord.Member) -> None:
-        active_character = charactersvc.get_active_character_by_user_id(member.id)
+        active_character = await db.read(charactersvc.get_active_character_by_user_id, member.id)
         if active_character is None:
             await inter.response.send_message('That user does not have an active character.')
             return
@@ -35,20 +43,33 @@ class CharacterCog(commands.GroupCog, name='character', description='Character c
     @app_commands.command(name="create", description="Creates a new character.")
     @app_commands.describe(charname="The character's name.")
     async def create_character(self, interaction: discord.Interaction, charname: str) -> None:
-        charactersvc.create_character(interaction.user.id, charname)
+        try:
+            await db.run(charactersvc.create_character, interaction.user.id, charname, interaction.guild_id)
+        except CharacterException as e:
+            await interaction.response.send_message(f'Failed to create character. {e}')
+            return
+
         await interaction.response.send_message('Character created.')
 
     @app_commands.command(name="activate", description="Activates an existing character.")
     @app_commands.describe(charname="The character's name.")
     async def activate_character(self, interaction: discord.Interaction, charname: str) -> None:
-        if charactersvc.activate_character(interaction.user.id, charname):
+        if await db.run(charactersvc.activate_character, interaction.user.id, charname):
             await interaction.response.send_message('Character activated.')
             return
 
         await interaction.response.send_message('Failed to activate character.')
 
+    @activate_character.autocomplete("charname")
+    async def own_character_name_autocomplete(self, inter: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        options = charactersvc.get_cached_character_names(current, inter.user.id, own=True)
+        if options is None:
+            options = await db.read(charactersvc.search_own_character_names, current, inter.user.id)
+        return [app_commands.Choice(name=option, value=option) for option in options]
+
     async def show_sheet_by_name(self, interaction: discord.Interaction, character_name: str) -> None:
-        matching_character = charactersvc.find_character_by_name(character_name)
+        matching_character = await db.read(charactersvc.find_character_by_name, character_name,
+                                           interaction.user.id, interaction.guild_id)
 
         if matching_character is None:
             await interaction.response.send_message('Could not find a character with that name.')
@@ -57,19 +78,24 @@ class CharacterCog(commands.GroupCog, name='character', description='Character c
         await interaction.response.send_message(f"Here's the sheet for {matching_character.name}.",
                                                 embed=self.format_sheet(interaction.user, matching_character))
 
-    def get_skills_sheet_by_attribute(self, character: Character, attribute: Attribute) -> str:
-        result = ''
-        for skill in models.stats.get_skills(attribute):
-            result += f"{models.stats.get_pretty_name(skill)}: {character.get_effective_skill(skill)}\n"
-        return result
+    def get_skills_sheet_by_attribute(self, effective_skills, attribute: Attribute) -> str:
+        return ''.join(f"{models.stats.get_pretty_name(skill)}: {effective_skills[models.stats.get_skill_index(skill)]}\n"
+                       for skill in models.stats.get_skills(attribute))
 
     def format_sheet(self, member: discord.Member, character: Character) -> discord.Embed:
+        key = (character.db_id, character.version, member.color.value)
+        embed = _sheet_cache.get(key)
+        if embed is not None:
+            return embed
+
         embed = discord.Embed(title=character.name, description=character.description, color=member.color)
+        effective_skills = character.get_effective_skills()
 
         for attribute in Attribute.__members__.values():
-            embed.add_field(name=f'{models.stats.get_pretty_name(attribute)}: {character.get_attribute(attribute)}',
-                            value=self.get_skills_sheet_by_attribute(character, attribute))
+            embed.add_field(name=f'{models.stats.get_pretty_name(attribute)}: {character.get_effective_attribute(attribute)}',
+                            value=self.get_skills_sheet_by_attribute(effective_skills, attribute))
 
+        _sheet_cache.put(key, embed)
         return embed
 
     @app_commands.command(name="sheet", description="Display your active character's sheet.")
@@ -81,7 +107,9 @@ class CharacterCog(commands.GroupCog, name='character', description='Character c
             return await self.show_sheet_by_name(interaction, character_name)
 
         user_id = other_user.id if other_user else interaction.user.id
-        character = charactersvc.get_active_character_by_user_id(user_id)
+        character = charactersvc.get_cached_active_character(user_id)
+        if character is None:
+            character = await db.read(charactersvc.get_active_character_by_user_id, user_id)
         if character is None:
             await interaction.response.send_message("No character found.")
             return
@@ -89,11 +117,18 @@ class CharacterCog(commands.GroupCog, name='character', description='Character c
         await interaction.response.send_message(f"Here's the sheet for {character.name}.",
                                                 embed=self.format_sheet(interaction.user, character))
 
+    @show_sheet.autocomplete("character_name")
+    async def character_name_autocomplete(self, inter: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        options = charactersvc.get_cached_character_names(current, inter.user.id, inter.guild_id)
+        if options is None:
+            options = await db.read(charactersvc.search_character_names, current, inter.user.id, inter.guild_id)
+        return [app_commands.Choice(name=option, value=option) for option in options]
+
     @app_commands.command(name="list", description="Display a list of all of your characters.")
     @app_commands.describe(other_user="Optionally view another user's characters. If ommitted, display your own characters.")
     async def list_characters(self, interaction: discord.Interaction, other_user: Optional[discord.Member]) -> None:
         user_id = other_user.id if other_user else interaction.user.id
-        character_list = charactersvc.get_characters_owned_by_user(user_id)
+        character_list = await db.read(charactersvc.get_characters_owned_by_user, user_id)
 
         if character_list is None:
             await interaction.response.send_message("There aren't any characters to show!")
@@ -107,7 +142,7 @@ class CharacterCog(commands.GroupCog, name='character', description='Character c
     @app_commands.describe(attribute_name="The name of the attribute to edit.", value="An integer to set the attribute's value to.")
     async def set_attribute(self, interaction: discord.Interaction, attribute_name: str, value: int) -> None:
         try:
-            charactersvc.set_attribute(interaction.user.id, attribute_name, value)
+            await db.run(charactersvc.set_attribute, interaction.user.id, attribute_name, value)
             await interaction.response.send_message("Attribute successfully set.")
         except CharacterException as e:
             await interaction.response.send_message(f"An error occurred while setting the attribute: {e}")
@@ -116,17 +151,25 @@ class CharacterCog(commands.GroupCog, name='character', description='Character c
     @app_commands.describe(skill_name="The name of the skill to edit.", value="An integer to set the skill's value to.")
     async def set_skill(self, interaction: discord.Interaction, skill_name: str, value: int) -> None:
         try:
-            charactersvc.set_skill(interaction.user.id, skill_name, value)
+            await db.run(charactersvc.set_skill, interaction.user.id, skill_name, value)
             await interaction.response.send_message("Skill successfully set.")
         except CharacterException as e:
             await interaction.response.send_message(f"An error occurred while setting the skill: {e}")
 
+    @app_commands.command(name="setstats", description="Set several of your character's attributes and skills at once.")
+    @app_commands.describe(stats="Stat names, each followed by its value, such as: INT 3 PSY 2 logic 2 empathy 1")
+    async def set_stats(self, interaction: discord.Interaction, stats: str) -> None:
+        try:
+            values = await db.run(charactersvc.set_stats, interaction.user.id, stats)
+            await interaction.response.send_message("Stats successfully set: " + ', '.join(
+                f"{models.stats.get_pretty_name(stat)} {value}" for stat, value in values.items()) + ".")
+        except CharacterException as e:
+            await interaction.response.send_message(f"An error occurred while setting the stats: {e}")
+
     @set_attribute.autocomplete("attribute_name")
     async def attribute_name_autocomplete(self, _: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-        options = models.stats.attribute_pretty_names.values()
-        return [app_commands.Choice(name=option, value=option) for option in options if option.casefold().startswith(current.casefold())][:25]
+        return choices.attribute_choices.filter(current)
 
     @set_skill.autocomplete("skill_name")
     async def skill_name_autocomplete(self, _: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-        options = models.stats.skill_pretty_names.values()
-        return [app_commands.Choice(name=option, value=option) for option in options if option.casefold().startswith(current.casefold())][:25]
+        return choices.skill_choices.filter(current)
@@ -0,0 +1,25 @@
+from discord import app_commands
+
+import models.stats
+from models.attribute import Attribute
+from models.difficulty import Difficulty
+from models.item_type import ItemType
+from models.skill import Skill
+
+class ChoiceList:
+    # Fixed autocomplete options, built once instead of on every keystroke
+    def __init__(self, choices: list[app_commands.Choice]) -> None:
+        self.choices = choices
+        self._folded = [(x.name.casefold(), x) for x in choices]
+
+    def filter(self, current: str) -> list[app_commands.Choice]:
+        current = current.casefold()
+        return [choice for name, choice in self._folded if name.startswith(current)][:25]
+
+attribute_choices = ChoiceList([app_commands.Choice(name=models.stats.get_pretty_name(x), value=models.stats.get_pretty_name(x)) for x in Attribute])
+skill_choices = ChoiceList([app_commands.Choice(name=models.stats.get_pretty_name(x), value=models.stats.get_pretty_name(x)) for x in Skill])
+item_type_choices = ChoiceList([app_commands.Choice(name=x.name, value=x.name) for x in ItemType])
+
+# Values are enum names, for commands that convert them straight back to the enum
+skill_name_choices = ChoiceList([app_commands.Choice(name=models.stats.get_pretty_name(x), value=x.name) for x in Skill])
+difficulty_choices = ChoiceList([app_commands.Choice(name=f'{x.name.capitalize()} ({x.value})', value=x.name) for x in Difficulty])
@@ -1,23 +1,42 @@
 from typing import Optional
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 import models
 from models.attribute import Attribute
 from models.item import Item
 from models.item_type import ItemType
 from models.skill import Skill
+from cogs import choices
 from services import itemsvc
+from util import db, metrics
+from util.cache import LRUCache
 from util.errors import ItemException, PermissionException, StatException
 
+# Rendered sheets by (item id, item version, embed color). Only used on the event loop.
+_sheet_cache = LRUCache(1024)
+
 async def setup(bot):
-    await bot.add_cog(ItemCog(bot))
+    cog = ItemCog(bot)
+    metrics.instrument_cog(cog)
+    await bot.add_cog(cog)
 
 class ItemCog(commands.GroupCog, name='item', description='Item commands'):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
 
+    async def cog_load(self) -> None:
+        await db.run(itemsvc.preload_items)
+        self.flush_inspections.start()
+
+    async def cog_unload(self) -> None:
+        self.flush_inspections.cancel()
+
+    @tasks.loop(minutes=5)
+    async def flush_inspections(self) -> None:
+        await db.run(itemsvc.flush_inspections)
+
     @app_commands.command(name="create", description="Creates a new item.")
     @app_commands.describe(itemname="The items's name.",
                            itemdesc="The description of the item.",
@@ -30,7 +49,7 @@ class ItemCog(commands.GroupCog, name='item', description='Item commands'):
             return
 
         try:
-            itemsvc.create_item(interaction.user.id, itemname, itemdesc, parsed_type)
+            await db.run(itemsvc.create_item, interaction.user.id, itemname, itemdesc, parsed_type)
         except ItemException as e:
             await interaction.response.send_message(f'Failed to create item. {e}')
             return
@@ -39,30 +58,37 @@ class ItemCog(commands.GroupCog, name='item', description='Item commands'):
 
     @create_item.autocomplete("itemtype")
     async def itemtype_autocomplete(self, _: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-        options = ItemType.__members__.keys()
-        return [app_commands.Choice(name=option, value=option) for option in options if option.casefold().startswith(current.casefold())][:25]
+        return choices.item_type_choices.filter(current)
 
     def format_sheet(self, member: discord.Member, item: Item) -> discord.Embed:
-        embed = discord.Embed(title=item.name, description=item.description, color=member.color)
-        embed.description = f'{item.description}\n\n'
+        key = (item.db_id, item.version, member.color.value)
+        embed = _sheet_cache.get(key)
+        if embed is not None:
+            return embed
 
+        lines = [f'{item.description}\n']
         for effect in item.effects:
             plus_sign = ''
             if effect.value > 0:
                 plus_sign = '+'
-            embed.description += f'{plus_sign}{effect.value} {models.stats.get_pretty_name(effect.stat)}: {effect.stat_desc}\n'
+            lines.append(f'{plus_sign}{effect.value} {models.stats.get_pretty_name(effect.stat)}: {effect.stat_desc}')
 
+        embed = discord.Embed(title=item.name, description='\n'.join(lines) + '\n', color=member.color)
         embed.set_image(url='https://goon.network/millerhighlife.png')
 
+        _sheet_cache.put(key, embed)
         return embed
 
     @app_commands.command(name="inspect", description="Show details about an item.")
     async def inspect_item(self, inter: discord.Interaction, item_name: str) -> None:
-        item = itemsvc.find_item_by_name(item_name)
+        item = itemsvc.get_cached_item(item_name)
+        if item is None:
+            item = await db.read(itemsvc.find_item_by_name, item_name)
         if item is None:
             await inter.response.send_message('An item with that name could not be found.')
             return
 
+        itemsvc.count_inspection(item)
         await inter.response.send_message(embed=self.format_sheet(inter.user, item))
 
     @app_commands.command(name="setattribute", description="Add an effect to an item that adjusts an Attribute.")
@@ -72,7 +98,7 @@ class ItemCog(commands.GroupCog, name='item', description='Item commands'):
                            stat_description="A short description detailing why the item applies this specific effect.")
     async def set_attribute(self, interaction: discord.Interaction, item_name: str, attribute_name: str, value: int, stat_description: str) -> None:
         try:
-            itemsvc.set_attribute(interaction.user.id, item_name, attribute_name, value, stat_description)
+            await db.run(itemsvc.set_attribute, interaction.user.id, item_name, attribute_name, value, stat_description)
             await interaction.response.send_message("Attribute successfully set.")
         except (ItemException, PermissionException, StatException) as e:
             await interaction.response.send_message(f"An error occurred while setting the attribute: {e}")
@@ -84,31 +110,33 @@ class ItemCog(commands.GroupCog, name='item', description='Item commands'):
                            stat_description="A short description detailing why the item applies this specific effect.")
     async def set_skill(self, interaction: discord.Interaction, item_name: str, skill_name: str, value: int, stat_description: str) -> None:
         try:
-            itemsvc.set_skill(interaction.user.id, item_name, skill_name, value, stat_description)
+            await db.run(itemsvc.set_skill, interaction.user.id, item_name, skill_name, value, stat_description)
             await interaction.response.send_message("Skill successfully set.")
         except (ItemException, PermissionException, StatException) as e:
             await interaction.response.send_message(f"An error occurred while setting the skill: {e}")
 
     @inspect_item.autocomplete("item_name")
     async def all_item_names_autocomplete(self, _: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-        options = itemsvc.roughly_search_all_item_names(current)
+        options = itemsvc.get_cached_item_names(current)
+        if options is None:
+            options = await db.read(itemsvc.roughly_search_all_item_names, current)
         return [app_commands.Choice(name=option, value=option) for option in options]
 
     @set_attribute.autocomplete("item_name")
     @set_skill.autocomplete("item_name")
     async def owned_item_names_autocomplete(self, inter: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-        options = itemsvc.roughly_search_item_names_by_user(current, inter.user.id)
+        options = itemsvc.get_cached_item_names(current, inter.user.id)
+        if options is None:
+            options = await db.read(itemsvc.roughly_search_item_names_by_user, current, inter.user.id)
         return [app_commands.Choice(name=option, value=option) for option in options]
 
     @set_attribute.autocomplete("attribute_name")
     async def attribute_name_autocomplete(self, _: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-        options = models.stats.attribute_pretty_names.values()
-        return [app_commands.Choice(name=option, value=option) for option in options if option.casefold().startswith(current.casefold())][:25]
+        return choices.attribute_choices.filter(current)
 
     @set_skill.autocomplete("skill_name")
     async def skill_name_autocomplete(self, _: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-        options = models.stats.skill_pretty_names.values()
-        return [app_commands.Choice(name=option, value=option) for option in options if option.casefold().startswith(current.casefold())][:25]
+        return choices.skill_choices.filter(current)
 
     # @app_commands.command(name="activate", description="Activates an existing character.")
     # @app_commands.describe(charname="The character's name.")
@@ -134,7 +162,7 @@ class ItemCog(commands.GroupCog, name='item', description='Item commands'):
     async def list_items(self, interaction: discord.Interaction, other_user: Optional[discord.Member]) -> None:
         user_id = other_user.id if other_user else interaction.user.id
 
-        item_list = itemsvc.get_items_owned_by_user(user_id)
+        item_list = await db.read(itemsvc.get_items_owned_by_user, user_id)
 
         if item_list is None:
             await interaction.response.send_message("There aren't any items to show!")
@@ -1,17 +1,124 @@
+import re
+from typing import Optional
+
 from discord import Colour, app_commands
 from discord.ext import commands
 
 import discord
 
+import models.stats
+from models.difficulty import Difficulty
+from models.roll import RollResult
+from models.skill import Skill
+from cogs import choices
+from services import rollsvc
+from util import db, metrics
+from util.errors import CharacterException
+
+_mention_pattern = re.compile(r'<@!?(\d+)>')
+
 async def setup(bot):
-    await bot.add_cog(RollCog(bot))
+    cog = RollCog(bot)
+    metrics.instrument_cog(cog)
+    await bot.add_cog(cog)
+
+def parse_skill(value: str) -> Optional[Skill]:
+    # Autocompleted values are enum names, but users may also type a name of their own
+    return Skill.__members__.get(value) or models.stats.get_skill_by_name(value)
+
+def format_result(result: RollResult) -> str:
+    dice = ' + '.join(str(x) for x in result.dice)
+    modifier = f' {result.modifier:+}' if result.modifier else ''
+    outcome = 'Success' if result.success else 'Failure'
+    if result.critical:
+        outcome = f'Critical {outcome.lower()}'
+    return f'{dice} + {result.skill_value}{modifier} = **{result.total}** vs {result.difficulty.value}: {outcome}'
 
 class RollCog(commands.GroupCog, name='roll', description='Roll commands'):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
 
-    @app_commands.command(name="logic", description="Makes a Logic roll.")
-    @app_commands.describe(body="The body of the message accompanying the roll.")
-    async def roll_logic(self, interaction: discord.Interaction, body: str) -> None:
-        embed = discord.Embed(title='Logic', description=body, color=Colour.blue())
+    @app_commands.command(name="check", description="Makes a skill check with your active character.")
+    @app_commands.describe(skill="The skill to roll.",
+                           difficulty="How hard the check is.",
+                           body="The body of the message accompanying the roll.",
+                           modifier="Optionally add a bonus or penalty to the roll.")
+    @app_commands.choices(difficulty=choices.difficulty_choices.choices)
+    async def roll_check(self, interaction: discord.Interaction, skill: str, difficulty: str, body: Optional[str], modifier: Optional[int]) -> None:
+        parsed_skill = parse_skill(skill)
+        if parsed_skill is None:
+            await interaction.response.send_message('Invalid skill name.' + models.stats.did_you_mean(models.stats.suggest_skills(skill)[:3]))
+            return
+
+        try:
+            result = await db.read(rollsvc.roll_skill, interaction.user.id, parsed_skill, Difficulty[difficulty], modifier or 0)
+        except CharacterException as e:
+            await interaction.response.send_message(f'An error occurred while rolling: {e}')
+            return
+
+        color = Colour.green() if result.success else Colour.red()
+        embed = discord.Embed(title=f'{models.stats.get_pretty_name(result.skill)} ({result.character.name})',
+                              description=body, color=color)
+        embed.add_field(name=result.difficulty.name.capitalize(), value=format_result(result))
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="group", description="Makes the same skill check for several players at once.")
+    @app_commands.describe(skill="The skill to roll.",
+                           difficulty="How hard the check is.",
+                           players="Mentions of every player whose active character rolls.")
+    @app_commands.choices(skill=choices.skill_name_choices.choices, difficulty=choices.difficulty_choices.choices)
+    async def roll_group(self, interaction: discord.Interaction, skill: str, difficulty: str, players: str) -> None:
+        user_ids = [int(x) for x in _mention_pattern.findall(players)]
+        if not user_ids:
+            await interaction.response.send_message('Mention at least one player to roll for.')
+            return
+
+        results = await db.read(rollsvc.roll_skill_for_users, user_ids, Skill[skill], Difficulty[difficulty])
+
+        lines = [f'{result.character.name} (<@{result.character.user_id}>): {format_result(result)}' for result in results]
+        rolled = { result.character.user_id for result in results }
+        lines.extend(f'<@{user_id}> has no active character.' for user_id in dict.fromkeys(user_ids) if user_id not in rolled)
+
+        embed = discord.Embed(title=f'{models.stats.get_pretty_name(Skill[skill])}: {Difficulty[difficulty].name.capitalize()}',
+                              description='\n'.join(lines), color=Colour.blue())
         await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="odds", description="Shows your active character's chance to pass a skill check.")
+    @app_commands.describe(skill="The skill to check.",
+                           difficulty="Optionally only show the odds against this difficulty.",
+                           modifier="Optionally add a bonus or penalty to the roll.")
+    @app_commands.choices(difficulty=choices.difficulty_choices.choices)
+    async def roll_odds(self, interaction: discord.Interaction, skill: str, difficulty: Optional[str], modifier: Optional[int]) -> None:
+        parsed_skill = parse_skill(skill)
+        if parsed_skill is None:
+            await interaction.response.send_message('Invalid skill name.' + models.stats.did_you_mean(models.stats.suggest_skills(skill)[:3]))
+            return
+
+        difficulties = [Difficulty[difficulty]] if difficulty else list(Difficulty)
+        try:
+            odds = await db.read(rollsvc.get_skill_odds, interaction.user.id, parsed_skill, difficulties, modifier or 0)
+        except CharacterException as e:
+            await interaction.response.send_message(f'An error occurred while calculating the odds: {e}')
+            return
+
+        lines = [f'{x.name.capitalize()} ({x.value}): {chance:.0%}' for x, chance in odds.items()]
+        embed = discord.Embed(title=f'{models.stats.get_pretty_name(parsed_skill)} odds', description='\n'.join(lines), color=Colour.blue())
+        await interaction.response.send_message(embed=embed)
+
+    @roll_check.autocomplete("skill")
+    @roll_odds.autocomplete("skill")
+    async def skill_odds_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        # Shows the live chance of success next to every skill
+        difficulty = Difficulty.__members__.get(str(interaction.namespace.difficulty), Difficulty.MEDIUM)
+        modifier = interaction.namespace.modifier or 0
+        try:
+            odds = await db.read(rollsvc.get_all_odds, interaction.user.id, difficulty, modifier)
+        except CharacterException:
+            odds = {}
+
+        options = []
+        for choice in choices.skill_name_choices.filter(current):
+            skill = Skill[choice.value]
+            name = f'{choice.name} ({odds[skill]:.0%})' if skill in odds else choice.name
+            options.append(app_commands.Choice(name=name, value=choice.value))
+        return options
@@ -1,12 +1,29 @@
+import dataclasses
+from array import array
+from typing import Optional
+
 from models.attribute import Attribute
 from models.item import Item
+from models.itemstat import ItemStat
 from models.skill import Skill
 from models import stats
 from models.slot import Slot
 from util.errors import CharacterException
 
+_EMPTY_STATS = array('h', [0] * stats.STAT_COUNT)
+# Effects of up to one item per slot are summed, which can exceed the 16 bit range of a single stat
+_EMPTY_MODIFIERS = array('i', [0] * stats.STAT_COUNT)
+_slot_ordinals = { slot: i for i, slot in enumerate(Slot) }
+
 class Character:
-    def __init__(self, db_id, user_id, name, description, image_url, health, morale) -> None:
+    # Characters are cached in large numbers, so they keep their stats in one flat array
+    # indexed by stats.get_ordinal() instead of per-instance dicts.
+    # _modifiers holds the summed effects of all equipped items in the same layout. It is adjusted
+    # whenever a single item is equipped, unequipped or changed, never recomputed from scratch.
+    __slots__ = ('db_id', 'user_id', 'name', 'description', 'image_url', 'health', 'morale', 'version',
+                 '_stats', '_modifiers', '_equipped_items')
+
+    def __init__(self, db_id, user_id, name, description, image_url, health, morale, version=0) -> None:
         # cursor.execute('''CREATE TABLE IF NOT EXISTS character
         #            (id INTEGER PRIMARY KEY, user_id, name, description, image_url, health, morale)''')
         self.db_id = db_id
@@ -16,33 +33,94 @@ class Character:
         self.image_url = image_url
         self.health = health
         self.morale = morale
-        self._attributes = { x:0 for x in Attribute.__members__.values() }
-        self._skills = { x:0 for x in Skill.__members__.values() }
-        self._equipped_items = { x:None for x in Slot.__members__.values() }
-        self._inventory = {}
+        # Increased by every write to the character (including what it wears) in the database
+        self.version = version
+        self._stats = array('h', _EMPTY_STATS)
+        self._modifiers = array('i', _EMPTY_MODIFIERS)
+        self._equipped_items = [None] * len(_slot_ordinals)
 
     def get_skills_by_attribute(self, attribute: Attribute) -> dict:
-        skills_of_attribute = stats.get_skills(attribute)
-        return dict((k, self._skills[k]) for k in skills_of_attribute if k in self._skills)
+        return dict((skill, self._stats[stats.get_ordinal(skill)]) for skill in stats.get_skills(attribute))
 
     def get_attribute(self, attribute: Attribute) -> int:
-        return self._attributes[attribute]
+        return self._stats[stats.get_ordinal(attribute)]
+
+    def get_effective_attribute(self, attribute: Attribute) -> int:
+        ordinal = stats.get_ordinal(attribute)
+        return self._stats[ordinal] + self._modifiers[ordinal]
 
     def get_effective_skill(self, skill: Skill) -> int:
-        matching_attribute = stats.get_attribute(skill)
-        attribute_value = self._attributes[matching_attribute]
-        return attribute_value + self._skills[skill]
+        ordinal = stats.get_ordinal(skill)
+        return self.get_effective_attribute(stats.get_attribute(skill)) + self._stats[ordinal] + self._modifiers[ordinal]
 
-    def set_attribute(self, attribute: Attribute, value: int) -> None:
+    def get_effective_skills(self) -> list[int]:
+        # Effective value of every skill, in Skill enum order
+        values = self._stats
+        modifiers = self._modifiers
+        return [values[skill] + values[attribute] + modifiers[skill] + modifiers[attribute]
+                for skill, attribute in stats.skill_ordinal_pairs]
+
+    def _set_stat(self, stat, value: int, kind: str) -> None:
         if value < 0:
-            raise CharacterException('Attribute value cannot be less than 0.')
-        self._attributes[attribute] = value
+            raise CharacterException(f'{kind} value cannot be less than 0.')
+        if value > stats.MAX_STAT_VALUE:
+            raise CharacterException(f'{kind} value cannot be greater than {stats.MAX_STAT_VALUE}.')
+        self._stats[stats.get_ordinal(stat)] = value
+
+    def set_attribute(self, attribute: Attribute, value: int) -> None:
+        self._set_stat(attribute, value, 'Attribute')
 
     def set_skill(self, skill: Skill, value: int) -> None:
-        if value < 0:
-            raise CharacterException('Skill value cannot be less than 0.')
-        self._skills[skill] = value
+        self._set_stat(skill, value, 'Skill')
+
+    def load_stats(self, attributes: dict, skills: dict) -> None:
+        # Bulk assignment of values read from the database, which are already known to be valid
+        for stat, value in attributes.items():
+            self._stats[stats.get_ordinal(stat)] = value
+        for stat, value in skills.items():
+            self._stats[stats.get_ordinal(stat)] = value
+
+    def _apply_effects(self, item: Item, sign: int) -> None:
+        for effect in item.effects:
+            self._modifiers[stats.get_ordinal(effect.stat)] += sign * effect.value
+
+    def get_equipped_items(self) -> list[Item]:
+        return [item for item in self._equipped_items if item is not None]
+
+    def equip_item(self, item: Item) -> Optional[Item]:
+        # Returns the item previously worn in the same slot, if any
+        slot = item.slot if isinstance(item.slot, Slot) else Slot[item.slot.upper()]
+        previous = self.unequip_item(slot)
+        # Keep a private copy, update_item_effect() edits its effects
+        item = dataclasses.replace(item, effects=list(item.effects))
+        self._equipped_items[_slot_ordinals[slot]] = item
+        self._apply_effects(item, 1)
+        return previous
+
+    def unequip_item(self, slot: Slot) -> Optional[Item]:
+        item = self._equipped_items[_slot_ordinals[slot]]
+        if item is not None:
+            self._equipped_items[_slot_ordinals[slot]] = None
+            self._apply_effects(item, -1)
+        return item
+
+    def update_item_effect(self, effect: ItemStat) -> bool:
+        # Applies a changed effect of an equipped item. A value of 0 removes the effect.
+        # Returns False if no item with that id is equipped.
+        for item in self._equipped_items:
+            if item is not None and item.db_id == effect.item_id:
+                break
+        else:
+            return False
+
+        old_value = 0
+        for i, existing in enumerate(item.effects):
+            if existing.stat == effect.stat:
+                old_value = existing.value
+                del item.effects[i]
+                break
 
-    def equip_item(self, item: Item):
-        slot = Slot[item.slot.upper()]
-        self._equipped_items[slot] = item
+        if effect.value != 0:
+            item.effects.append(effect)
+        self._modifiers[stats.get_ordinal(effect.stat)] += effect.value - old_value
+        return True
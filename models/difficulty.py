@@ -0,0 +1,13 @@
+from enum import Enum
+
+# Target a 2d6 + skill check has to reach
+class Difficulty(Enum):
+    TRIVIAL = 6
+    EASY = 8
+    MEDIUM = 10
+    CHALLENGING = 12
+    FORMIDABLE = 13
+    LEGENDARY = 14
+    HEROIC = 15
+    GODLY = 16
+    IMPOSSIBLE = 18
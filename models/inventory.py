@@ -0,0 +1,9 @@
+from dataclasses import dataclass
+
+from models.item import Item
+
+@dataclass(slots=True)
+class InventoryEntry:
+    item: Item
+    quantity: int
+    equipped: bool
@@ -5,7 +5,7 @@ from models.item_type import ItemType
 from models.itemstat import ItemStat
 from models.slot import Slot
 
-@dataclass
+@dataclass(slots=True)
 class Item:
     db_id: int
     user_id: int
@@ -15,6 +15,7 @@ class Item:
     slot: Slot
     item_type: ItemType
     duration: int
+    version: int = 0
     effects: list[ItemStat] = field(default_factory=list)
 
 def construct_item(db_item) -> Optional[Item]:
@@ -5,7 +5,7 @@ from models.attribute import Attribute
 from models.skill import Skill
 from util.errors import StatException
 
-@dataclass
+@dataclass(slots=True)
 class ItemStat:
     item_id: int
     stat: any
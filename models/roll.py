@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+
+from models.character import Character
+from models.difficulty import Difficulty
+from models.skill import Skill
+
+@dataclass(slots=True)
+class RollResult:
+    character: Character
+    skill: Skill
+    difficulty: Difficulty
+    dice: tuple[int, ...]
+    skill_value: int
+    modifier: int
+    total: int
+    success: bool
+    critical: bool
@@ -1,17 +1,12 @@
+import bisect
+import difflib
+import functools
 from typing import Optional
 
 from models.skill import Skill
 from models.attribute import Attribute
 from util.errors import StatException
 
-def get_attribute_by_name(query: str) -> Optional[Attribute]:
-    match = None
-
-    for name, attribute in Attribute.__members__.items():
-        if name.casefold() == query.casefold():
-            match = attribute
-    return match
-
 _attribute_to_skills = {
     Attribute.INTELLECT: [ Skill.LOGIC, Skill.ENCYCLOPEDIA, Skill.RHETORIC, Skill.DRAMA, Skill.CONCEPTUALIZATION, Skill.VISUALCALCULUS ],
     Attribute.PSYCHE: [ Skill.VOLITION, Skill.INLANDEMPIRE, Skill.EMPATHY, Skill.AUTHORITY, Skill.ESPRITDECORPS, Skill.SUGGESTION ],
@@ -55,6 +50,23 @@ _skills_to_attribute = {
 def get_attribute(skill: Skill):
     return _skills_to_attribute[skill]
 
+# Dense ordinals for storing stats in flat arrays: attributes first, then skills in enum order
+_stat_ordinals = { stat: i for i, stat in enumerate([*Attribute, *Skill]) }
+STAT_COUNT = len(_stat_ordinals)
+
+# Stats are stored as signed 16 bit integers
+MAX_STAT_VALUE = 32767
+
+# (skill ordinal, ordinal of the skill's attribute) for every skill, in enum order
+skill_ordinal_pairs = tuple((_stat_ordinals[skill], _stat_ordinals[_skills_to_attribute[skill]]) for skill in Skill)
+
+def get_ordinal(skill_or_attribute) -> int:
+    return _stat_ordinals[skill_or_attribute]
+
+def get_skill_index(skill: Skill) -> int:
+    # Position of the skill in per-skill arrays such as Character.get_effective_skills()
+    return _stat_ordinals[skill] - len(Attribute)
+
 attribute_pretty_names = {
     Attribute.INTELLECT: "Intellect",
     Attribute.PSYCHE: "Psyche",
@@ -99,6 +111,15 @@ def get_pretty_name(skill_or_attribute) -> str:
         return skill_pretty_names[skill_or_attribute]
     raise StatException('Given parameter was not an Attribute or Skill.')
 
+# The abbreviations used on Disco Elysium character sheets
+attribute_aliases = {
+    "int": Attribute.INTELLECT,
+    "psy": Attribute.PSYCHE,
+    "fys": Attribute.PHYSIQUE,
+    "phy": Attribute.PHYSIQUE,
+    "mot": Attribute.MOTORICS
+}
+
 skill_aliases = {
     "encyc": Skill.ENCYCLOPEDIA,
     "ency": Skill.ENCYCLOPEDIA,
@@ -168,15 +189,85 @@ skill_aliases = {
     "compose": Skill.COMPOSURE
 }
 
-def get_skill_by_name(query: str) -> Optional[Skill]:
-    match = None
+def _lookup_key(name: str) -> str:
+    # "Hand/Eye Coordination", "hand eye coordination" and "HANDEYECOORDINATION" all share a key
+    return ''.join(c for c in name.casefold() if c.isalnum())
+
+def _build_lookup(members: dict, pretty_names: dict, aliases: dict) -> dict:
+    lookup = {}
+    for name, stat in members.items():
+        lookup[_lookup_key(name)] = stat
+    for stat, pretty_name in pretty_names.items():
+        lookup[_lookup_key(pretty_name)] = stat
+    for alias, stat in aliases.items():
+        lookup[_lookup_key(alias)] = stat
+    return lookup
+
+# Every accepted spelling of every stat, built once so resolving a name is a single dict lookup
+_attribute_lookup = _build_lookup(Attribute.__members__, attribute_pretty_names, attribute_aliases)
+_skill_lookup = _build_lookup(Skill.__members__, skill_pretty_names, skill_aliases)
+_sorted_attribute_keys = sorted(_attribute_lookup)
+_sorted_skill_keys = sorted(_skill_lookup)
+
+def _candidates(lookup: dict, sorted_keys: list, key: str) -> list:
+    # Stats with a spelling starting with key, or failing that the closest spellings by edit distance
+    matches = []
+    for name in sorted_keys[bisect.bisect_left(sorted_keys, key):]:
+        if not name.startswith(key):
+            break
+        if lookup[name] not in matches:
+            matches.append(lookup[name])
+
+    if not matches:
+        for name in difflib.get_close_matches(key, sorted_keys, n=5, cutoff=0.75):
+            if lookup[name] not in matches:
+                matches.append(lookup[name])
+
+    return matches
+
+@functools.lru_cache(maxsize=1024)
+def suggest_attributes(query: str) -> tuple[Attribute, ...]:
+    key = _lookup_key(query)
+    if key in _attribute_lookup:
+        return (_attribute_lookup[key],)
+    return tuple(_candidates(_attribute_lookup, _sorted_attribute_keys, key))
+
+@functools.lru_cache(maxsize=1024)
+def suggest_skills(query: str) -> tuple[Skill, ...]:
+    key = _lookup_key(query)
+    if key in _skill_lookup:
+        return (_skill_lookup[key],)
+    return tuple(_candidates(_skill_lookup, _sorted_skill_keys, key))
 
-    # check aliases first
-    for alias, skill in skill_aliases.items():
-        if alias.casefold() == query.casefold():
-            return skill
+def get_attribute_by_name(query: str) -> Optional[Attribute]:
+    attribute = _attribute_lookup.get(_lookup_key(query))
+    if attribute is not None:
+        return attribute
+
+    # Accept abbreviations and typos as long as they point at a single attribute
+    candidates = suggest_attributes(query)
+    return candidates[0] if len(candidates) == 1 else None
 
-    for name, skill in Skill.__members__.items():
-        if name.casefold() == query.casefold():
-            match = skill
-    return match
+def get_skill_by_name(query: str) -> Optional[Skill]:
+    skill = _skill_lookup.get(_lookup_key(query))
+    if skill is not None:
+        return skill
+
+    candidates = suggest_skills(query)
+    return candidates[0] if len(candidates) == 1 else None
+
+def get_stat_by_name(query: str):
+    # An attribute or a skill, for input that may name either
+    key = _lookup_key(query)
+    stat = _attribute_lookup.get(key) or _skill_lookup.get(key)
+    if stat is not None:
+        return stat
+
+    candidates = suggest_attributes(query) + suggest_skills(query)
+    return candidates[0] if len(candidates) == 1 else None
+
+def did_you_mean(candidates) -> str:
+    # Suffix for error messages about a stat name that could not be resolved
+    if not candidates:
+        return ''
+    return f' Did you mean {" or ".join(get_pretty_name(x) for x in candidates)}?'
@@ -1,9 +1,77 @@
+import os
+import threading
 from typing import Optional
 
+from models.attribute import Attribute
 from models.character import Character
+from models.item import construct_item
+from models.itemstat import ItemStat, construct_itemstat
+from models.skill import Skill
 import models.stats
+from util.cache import AutocompleteCache, LRUCache
 from util.errors import CharacterException
-from util import db
+from util import changelog, db
+
+CHARACTER_CACHE_SIZE = int(os.environ.get('BALLROOM_CHARACTER_CACHE_SIZE', 4096))
+CHARACTER_NAME_SEARCH_LIMIT = 25
+# guild_id of characters from before guilds were recorded, which every guild can see.
+# Characters created outside a guild (in DMs) have none and only their owner sees them.
+LEGACY_GUILD_ID = 0
+
+# Attribute and skill edits are held back for this many milliseconds, so repeated edits of the same stat
+# are written once and all of them share one transaction. Set to 0 to write every edit right away.
+STAT_WRITE_DELAY_MS = float(os.environ.get('BALLROOM_STAT_WRITE_DELAY_MS', 1000))
+STAT_WRITE_MAX_PENDING = 1024
+
+# Hydrated characters by character id, and which character id (or None) each user has active.
+# Every write below that changes what these hold drops the affected entry.
+_character_cache = LRUCache(CHARACTER_CACHE_SIZE)
+_active_character_ids = LRUCache(CHARACTER_CACHE_SIZE)
+_MISSING = object()
+
+# Results of the search_*character_names functions, for autocomplete
+_character_name_completions = AutocompleteCache(maxsize=4096, ttl=30, limit=CHARACTER_NAME_SEARCH_LIMIT,
+                                                match_anywhere=False)
+
+# Ids of cached characters wearing each item, so item edits can update their modifiers in place.
+# May contain characters that have since left the cache; those are dropped when found.
+_characters_by_equipped_item = {}
+
+# Bumped by every change to cached characters. Loads only fill the caches if nothing changed while they ran,
+# because a reader thread sees the database as of the last commit and may have missed a write still waiting for it.
+_cache_lock = threading.Lock()
+_generation = 0
+
+# Stat edits not written yet, (character id, table, stat name) -> value, and how many edits each character has pending.
+# The characters they were made to are held in _edited_characters with the edits applied, and returned by every
+# lookup instead of what the database has, until the edits are committed. All three are guarded by _cache_lock.
+_pending_stats = {}
+_pending_versions = {}
+_edited_characters = {}
+# Edited characters another bot process has written to since. They are reloaded once their edits are written.
+_stale_edited_characters = set()
+
+# Loads characters, all of their stats and their equipped items with effects in one statement.
+# Rows are (kind, character id, ...): kind 0 is the character itself, 1 an attribute and 2 a skill
+# as (kind, character id, name, value), 3 an equipped item and 4 an effect of an equipped item as an item_stat row.
+_HYDRATE_CHARACTERS_SQL = '''
+    SELECT 0, id, id, user_id, name, description, image_url, health, morale, version, NULL FROM character WHERE id IN {targets}
+    UNION ALL
+    SELECT 1, character_id, attribute_name, value, NULL, NULL, NULL, NULL, NULL, NULL, NULL FROM attribute WHERE character_id IN {targets}
+    UNION ALL
+    SELECT 2, character_id, skill_name, value, NULL, NULL, NULL, NULL, NULL, NULL, NULL FROM skill WHERE character_id IN {targets}
+    UNION ALL
+    SELECT 3, inventory.character_id, item.id, item.user_id, item.name, item.description, item.image_url, item.slot, item.item_type, item.duration, item.version
+        FROM inventory JOIN item ON item.id = inventory.item_id
+        WHERE inventory.character_id IN {targets} AND inventory.equipped
+    UNION ALL
+    SELECT 4, inventory.character_id, item_stat.item_id, item_stat.stat_name, item_stat.stat_desc, item_stat.value, NULL, NULL, NULL, NULL, NULL
+        FROM inventory JOIN item_stat ON item_stat.item_id = inventory.item_id
+        WHERE inventory.character_id IN {targets} AND inventory.equipped'''
+
+_HYDRATE_BY_ID_SQL = _HYDRATE_CHARACTERS_SQL.format(targets='(:character_id)')
+_HYDRATE_ACTIVE_SQL = _HYDRATE_CHARACTERS_SQL.format(
+    targets='(SELECT character_id FROM active_character WHERE user_id = :user_id)')
 
 def db_activate_character(user_id: int, character_id: int) -> None:
     cursor = db.conn.cursor()
@@ -14,64 +82,317 @@ def db_activate_character(user_id: int, character_id: int) -> None:
         cursor.execute('INSERT INTO active_character (user_id, character_id) VALUES (?, ?)', (user_id, character_id))
     else:
         cursor.execute('UPDATE active_character SET character_id = ? WHERE user_id = ?', (character_id, user_id))
-    db.conn.commit()
+    changelog.record(changelog.ACTIVE_CHARACTER, [user_id])
+    db.commit()
     cursor.close()
+    invalidate_characters(user_ids=[user_id])
 
-def create_character(user_id: int, name: str) -> None:
+def create_character(user_id: int, name: str, guild_id: Optional[int] = None) -> None:
     cursor = db.conn.cursor()
-    cursor.execute('INSERT INTO character (user_id, name) VALUES (?, ?)', (user_id, name,))
+    cursor.execute('SELECT COUNT(*) FROM character WHERE user_id = ? AND name_key = ?', (user_id, db.name_key(name)))
+    if cursor.fetchone()[0] != 0:
+        cursor.close()
+        raise CharacterException('You already have a character with that name.')
+
+    cursor.execute('INSERT INTO character (user_id, name, name_key, guild_id) VALUES (?, ?, ?, ?)',
+                   (user_id, name, db.name_key(name), guild_id))
     character_id = cursor.lastrowid
     cursor.close()
-    db.conn.commit()
+    changelog.record(changelog.CHARACTER_NAMES)
+    db.commit()
+    _character_name_completions.invalidate(name)
+    db.after_commit(lambda: _character_name_completions.invalidate(name))
+    # Also drops the cached active character id of this user
     db_activate_character(user_id, character_id)
 
 def activate_character(user_id: int, name: str) -> bool:
-    character_list = get_characters_owned_by_user(user_id)
-    if character_list is None:
+    cursor = db.conn.cursor()
+    cursor.execute('SELECT id FROM character WHERE user_id = ? AND name_key = ? ORDER BY id LIMIT 1', (user_id, db.name_key(name)))
+    row = cursor.fetchone()
+    cursor.close()
+    if row is None:
         return False
 
-    match = None
-    for character in character_list:
-        if character.name == name:
-            match = character
+    db_activate_character(user_id, row[0])
+    return True
 
-    if match is None:
-        return False
+def find_character_by_name(character_name: str, user_id: int, guild_id: Optional[int] = None) -> Optional[Character]:
+    # Looks among the user's own characters, those created in the guild and the legacy ones.
+    # The user's own character wins if several share the name.
+    # Each group is looked up on its own index and limited to its first match, however many characters share the name.
+    groups = ['SELECT id, 0 AS rank FROM character WHERE user_id = :user_id AND name_key = :name_key ORDER BY id LIMIT 1']
+    if guild_id is not None:
+        groups.append('SELECT id, 1 AS rank FROM character WHERE guild_id = :guild_id AND name_key = :name_key ORDER BY id LIMIT 1')
+    groups.append('SELECT id, 1 AS rank FROM character WHERE guild_id = :legacy AND name_key = :name_key ORDER BY id LIMIT 1')
 
-    db_activate_character(user_id, match.id)
-    return True
+    cursor = db.connection().cursor()
+    cursor.execute(' UNION ALL '.join(f'SELECT * FROM ({x})' for x in groups) + ' ORDER BY rank, id LIMIT 1',
+                   {'name_key': db.name_key(character_name), 'user_id': user_id, 'guild_id': guild_id, 'legacy': LEGACY_GUILD_ID})
+    row = cursor.fetchone()
+    cursor.close()
+    if row is None:
+        return None
+    return get_character_by_id(row[0])
 
-def find_character_by_name(character_name: str) -> Optional[Character]:
-    cursor = db.conn.cursor()
-    cursor.execute('SELECT * FROM character WHERE name = ?', (character_name,))
-    return Character(-1, -1, 'Unimplemented', '', '', 0, 0)
+def _search_character_names(character_name: str, user_id: int, guild_id: Optional[int], own: bool) -> list[str]:
+    # Names starting with character_name, from the same characters as find_character_by_name() (or only the user's).
+    # Each group is a range on its own index, limited before they are merged.
+    params = {
+        'user_id': user_id,
+        'guild_id': guild_id,
+        'legacy': LEGACY_GUILD_ID,
+        'start': db.name_key(character_name),
+        'end': db.name_key(character_name) + '\U0010ffff',
+        'limit': CHARACTER_NAME_SEARCH_LIMIT,
+    }
+    range_filter = 'name_key >= :start AND name_key < :end ORDER BY name_key LIMIT :limit'
+    groups = [f'SELECT name, name_key FROM character WHERE user_id = :user_id AND {range_filter}']
+    if not own:
+        if guild_id is not None:
+            groups.append(f'SELECT name, name_key FROM character WHERE guild_id = :guild_id AND {range_filter}')
+        groups.append(f'SELECT name, name_key FROM character WHERE guild_id = :legacy AND {range_filter}')
+
+    cursor = db.connection().cursor()
+    cursor.execute(' UNION '.join(f'SELECT * FROM ({x})' for x in groups) + ' ORDER BY name_key LIMIT :limit', params)
+    names = [x[0] for x in cursor.fetchall()]
+    cursor.close()
+    return names
+
+def search_character_names(character_name: str, user_id: int, guild_id: Optional[int] = None) -> list[str]:
+    names = _search_character_names(character_name, user_id, guild_id, own=False)
+    _character_name_completions.put(f'guild {guild_id}', user_id, character_name, names)
+    return names
+
+def search_own_character_names(character_name: str, user_id: int) -> list[str]:
+    names = _search_character_names(character_name, user_id, None, own=True)
+    _character_name_completions.put('owned', user_id, character_name, names)
+    return names
+
+# Answers a search from earlier results without touching the database, if possible.
+# Safe to call from the event loop. Returns None when the search has to run.
+def get_cached_character_names(character_name: str, user_id: int, guild_id: Optional[int] = None, own: bool = False) -> Optional[list[str]]:
+    return _character_name_completions.get('owned' if own else f'guild {guild_id}', user_id, character_name)
+
+def _invalidate(character_ids, user_ids) -> None:
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        for character_id in character_ids:
+            _character_cache.pop(character_id)
+            # Edited characters were changed in place and stay; only what they wear may be new
+            if character_id in _edited_characters:
+                track_equipped_items(_edited_characters[character_id])
+        for user_id in user_ids:
+            _active_character_ids.pop(user_id)
+
+def invalidate_characters(character_ids=(), user_ids=()) -> None:
+    # Drops cached characters (and active character ids) after a write, now and again once it is committed
+    _invalidate(character_ids, user_ids)
+    db.after_commit(lambda: _invalidate(character_ids, user_ids))
+
+def _load_characters(sql: str, params: dict) -> dict[int, Character]:
+    cursor = db.connection().cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    cursor.close()
+
+    characters = {}
+    stats = {}
+    equipped_items = {}
+    effects = []
+    for row in rows:
+        if row[0] == 0:
+            characters[row[1]] = Character(*row[2:10])
+        elif row[0] == 1:
+            stats.setdefault(row[1], ({}, {}))[0][Attribute[row[2]]] = row[3]
+        elif row[0] == 2:
+            stats.setdefault(row[1], ({}, {}))[1][Skill[row[2]]] = row[3]
+        elif row[0] == 3:
+            item = construct_item(row[2:])
+            equipped_items.setdefault(row[1], {})[item.db_id] = item
+        else:
+            effects.append((row[1], construct_itemstat(row[2:6])))
+
+    for character_id, effect in effects:
+        equipped_items[character_id][effect.item_id].effects.append(effect)
+
+    for character in characters.values():
+        if character.db_id in stats:
+            character.load_stats(*stats[character.db_id])
+
+        for item in equipped_items.get(character.db_id, {}).values():
+            if item.slot is not None:
+                character.equip_item(item)
+
+    return characters
+
+def _remember(generation: int, characters: dict[int, Character], active_character_ids: dict) -> None:
+    # Caches what a load started at generation found, unless something changed since.
+    # Loaded characters that are edited or cached already are replaced in characters by those copies,
+    # which every write keeps up to date, while the load may predate a write or miss unwritten stat edits.
+    with _cache_lock:
+        for character_id in characters:
+            current = _edited_characters.get(character_id) or _character_cache.peek(character_id)
+            if current is not None:
+                characters[character_id] = current
+
+        if generation != _generation:
+            return
+        for character in characters.values():
+            _character_cache.put(character.db_id, character)
+            track_equipped_items(character)
+        for user_id, character_id in active_character_ids.items():
+            _active_character_ids.put(user_id, character_id)
+
+def get_character_by_id(character_id: int) -> Optional[Character]:
+    character = _edited_characters.get(character_id) or _character_cache.get(character_id)
+    if character is not None:
+        return character
+
+    generation = _generation
+    characters = _load_characters(_HYDRATE_BY_ID_SQL, {'character_id': character_id})
+    _remember(generation, characters, {})
+    return characters.get(character_id)
 
 def get_active_character_by_user_id(user_id: int) -> Optional[Character]:
-    cursor = db.conn.cursor()
-    cursor.execute('SELECT character_id FROM active_character WHERE user_id = ?', (user_id,))
-    char_id = cursor.fetchone()
-    if char_id is None:
+    character_id = _active_character_ids.get(user_id, _MISSING)
+    if character_id is None:
         return None
-    cursor.execute('SELECT id, user_id, name, description, image_url, health, morale FROM character WHERE id = ?', (char_id[0],))
-    db_character = cursor.fetchone()
-    character = Character(*db_character)
+    if character_id is not _MISSING:
+        return get_character_by_id(character_id)
 
-    cursor.execute('SELECT attribute_name, value FROM attribute WHERE character_id = ?', (char_id[0],))
-    db_attributes = cursor.fetchall()
-    for db_attribute in db_attributes:
-        character.set_attribute(models.stats.get_attribute_by_name(db_attribute[0]), db_attribute[1])
+    generation = _generation
+    characters = _load_characters(_HYDRATE_ACTIVE_SQL, {'user_id': user_id})
+    character_id = next(iter(characters), None)
+    _remember(generation, characters, {user_id: character_id})
+    return characters.get(character_id)
 
-    cursor.execute('SELECT skill_name, value FROM skill WHERE character_id = ?', (char_id[0],))
-    db_skills = cursor.fetchall()
-    for db_skill in db_skills:
-        character.set_skill(models.stats.get_skill_by_name(db_skill[0]), db_skill[1])
+def get_cached_active_character(user_id: int) -> Optional[Character]:
+    # Safe to call from the event loop, as it only reads the caches.
+    # Returns None when get_active_character_by_user_id has to run instead.
+    character_id = _active_character_ids.peek(user_id)
+    if character_id is None:
+        return None
+    return _character_cache.peek(character_id)
 
-    cursor.close()
-    return character
+def get_active_characters_by_user_ids(user_ids: list[int]) -> dict[int, Character]:
+    # Active characters of many users by user id, loading every one that is not cached in a single statement.
+    # Users without an active character are left out.
+    characters = {}
+    missing = []
+    for user_id in user_ids:
+        character_id = _active_character_ids.get(user_id, _MISSING)
+        if character_id is _MISSING:
+            missing.append(user_id)
+        elif character_id is not None:
+            character = get_character_by_id(character_id)
+            if character is not None:
+                characters[user_id] = character
+
+    if missing:
+        placeholders = ', '.join(f':user_{i}' for i in range(len(missing)))
+        sql = _HYDRATE_CHARACTERS_SQL.format(
+            targets=f'(SELECT character_id FROM active_character WHERE user_id IN ({placeholders}))')
+        generation = _generation
+        loaded = _load_characters(sql, { f'user_{i}': user_id for i, user_id in enumerate(missing) })
+
+        loaded_by_user = { character.user_id: character.db_id for character in loaded.values() }
+        active_character_ids = { user_id: loaded_by_user.get(user_id) for user_id in missing }
+        _remember(generation, loaded, active_character_ids)
+        for user_id, character_id in active_character_ids.items():
+            if character_id is not None:
+                characters[user_id] = loaded[character_id]
+
+    return characters
+
+def track_equipped_items(character: Character) -> None:
+    # Call after changing what a cached character is wearing, holding _cache_lock
+    for item in character.get_equipped_items():
+        _characters_by_equipped_item.setdefault(item.db_id, set()).add(character.db_id)
+
+def update_equipped_item_effect(effect: ItemStat) -> None:
+    # Applies an edited item effect to every cached character wearing the item.
+    # itemsvc has increased the version of those characters in the database, so do the same here.
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        character_ids = _characters_by_equipped_item.get(effect.item_id, set())
+
+        for character_id in list(character_ids):
+            character = _edited_characters.get(character_id) or _character_cache.peek(character_id)
+            if character is None or not character.update_item_effect(effect):
+                character_ids.discard(character_id)
+            else:
+                character.version += 1
+
+        if not character_ids:
+            _characters_by_equipped_item.pop(effect.item_id, None)
+
+    # A reader may load a wearer from before the edit until it is committed. If it is rolled back instead,
+    # the wearers changed above are wrong.
+    db.after_commit(lambda: _invalidate_wearers(effect.item_id), on_rollback=lambda: _invalidate_wearers(effect.item_id))
+
+def _invalidate_wearers(item_id: int) -> None:
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        wearers = _characters_by_equipped_item.pop(item_id, set())
+        for character_id in wearers:
+            _character_cache.pop(character_id)
+        # Edited characters are not reloaded, so they still need to hear of later edits to the item
+        edited = { x for x in wearers if x in _edited_characters }
+        if edited:
+            _characters_by_equipped_item[item_id] = edited
+
+def _drop_remote_changes(character_ids=None, user_ids=None) -> None:
+    # Drops what other bot processes changed from the caches, or everything if the ids are None
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        if character_ids is None:
+            _character_cache.clear()
+            _characters_by_equipped_item.clear()
+            _stale_edited_characters.update(_edited_characters)
+            for character in _edited_characters.values():
+                track_equipped_items(character)
+        else:
+            for character_id in character_ids:
+                _character_cache.pop(character_id)
+                if character_id in _edited_characters:
+                    _stale_edited_characters.add(character_id)
+
+        if user_ids is None:
+            _active_character_ids.clear()
+        else:
+            for user_id in user_ids:
+                _active_character_ids.pop(user_id)
+
+def _drop_remote_item_changes(item_ids) -> None:
+    if item_ids is None:
+        _drop_remote_changes(None, ())
+        return
+    with _cache_lock:
+        character_ids = set()
+        for item_id in item_ids:
+            character_ids.update(_characters_by_equipped_item.get(item_id, ()))
+    _drop_remote_changes(character_ids, ())
+
+changelog.subscribe(changelog.CHARACTER, lambda character_ids: _drop_remote_changes(character_ids, ()))
+changelog.subscribe(changelog.ACTIVE_CHARACTER, lambda user_ids: _drop_remote_changes((), user_ids))
+changelog.subscribe(changelog.ITEM, _drop_remote_item_changes)
+changelog.subscribe(changelog.CHARACTER_NAMES, lambda _: _character_name_completions.clear())
+
+def cache_stats() -> dict:
+    return {
+        'characters': _character_cache.stats(),
+        'active_characters': _active_character_ids.stats(),
+        'character_name_completions': _character_name_completions.stats(),
+        'pending_stat_edits': len(_pending_stats),
+    }
 
 def get_characters_owned_by_user(user_id: int) -> Optional[list]:
-    cursor = db.conn.cursor()
-    cursor.execute('SELECT * FROM character WHERE user_id = ?', (user_id,))
+    cursor = db.connection().cursor()
+    cursor.execute('SELECT id, user_id, name, description, image_url, health, morale, version FROM character WHERE user_id = ?', (user_id,))
     output = cursor.fetchall()
     characters = []
     for row in output:
@@ -79,6 +400,90 @@ def get_characters_owned_by_user(user_id: int) -> Optional[list]:
     cursor.close()
     return characters
 
+def _hold_stat_edits(character: Character, edits: dict) -> None:
+    # Records edits already applied to character, (table, stat name) -> value, to be written by flush_stat_edits().
+    # Edits held together are written in the same transaction.
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        character.version += 1
+        for (table, stat_name), value in edits.items():
+            _pending_stats[(character.db_id, table, stat_name)] = value
+        _pending_versions[character.db_id] = _pending_versions.get(character.db_id, 0) + 1
+        _edited_characters[character.db_id] = character
+        _character_cache.put(character.db_id, character)
+        pending = len(_pending_stats)
+
+    # Only the worker holds edits back. Elsewhere (scripts, migrations) they are written right away.
+    if STAT_WRITE_DELAY_MS <= 0 or not db.on_worker_thread() or pending >= STAT_WRITE_MAX_PENDING:
+        flush_stat_edits()
+    else:
+        db.defer('character_stats', flush_stat_edits, STAT_WRITE_DELAY_MS / 1000)
+
+def flush_stat_edits() -> None:
+    # Writes every held back stat edit in one transaction
+    global _pending_stats, _pending_versions
+    with _cache_lock:
+        if not _pending_stats:
+            return
+        edits, _pending_stats = _pending_stats, {}
+        versions, _pending_versions = _pending_versions, {}
+        characters = { x: _edited_characters[x] for x in versions }
+
+    cursor = db.conn.cursor()
+    try:
+        cursor.executemany(('INSERT INTO attribute (character_id, attribute_name, value) VALUES (?, ?, ?) '
+                            'ON CONFLICT (character_id, attribute_name) DO UPDATE SET value = excluded.value'),
+                           ((character_id, name, value) for (character_id, table, name), value in edits.items() if table == 'attribute'))
+        cursor.executemany(('INSERT INTO skill (character_id, skill_name, value) VALUES (?, ?, ?) '
+                            'ON CONFLICT (character_id, skill_name) DO UPDATE SET value = excluded.value'),
+                           ((character_id, name, value) for (character_id, table, name), value in edits.items() if table == 'skill'))
+        cursor.executemany('UPDATE character SET version = version + ? WHERE id = ?',
+                           ((count, character_id) for character_id, count in versions.items()))
+        changelog.record(changelog.CHARACTER, versions)
+    except Exception:
+        # The edits are lost, so the characters must not keep showing them either
+        _release_edited_characters(characters, keep=False)
+        raise
+    finally:
+        cursor.close()
+
+    db.commit()
+    db.after_commit(lambda: _release_edited_characters(characters, keep=True),
+                    on_rollback=lambda: _retry_stat_edits(edits, versions, characters))
+
+def _retry_stat_edits(edits: dict, versions: dict[int, int], characters: dict[int, Character]) -> None:
+    # The transaction writing the edits was rolled back. The characters still show them, so they are held again
+    # (behind newer edits of the same stats) and written with the next flush. Once closing they are given up.
+    global _generation, _pending_stats
+    if db.closing():
+        _release_edited_characters(characters, keep=False)
+        return
+
+    with _cache_lock:
+        _generation += 1
+        _pending_stats = { **edits, **_pending_stats }
+        for character_id, count in versions.items():
+            _pending_versions[character_id] = _pending_versions.get(character_id, 0) + count
+            _edited_characters.setdefault(character_id, characters[character_id])
+    db.defer('character_stats', flush_stat_edits, STAT_WRITE_DELAY_MS / 1000)
+
+def _release_edited_characters(characters: dict[int, Character], keep: bool) -> None:
+    # Once readers can see the edits, edited characters are cached like any other, unless edited again meanwhile
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        for character_id, character in characters.items():
+            if character_id in _pending_versions or _edited_characters.get(character_id) is not character:
+                continue
+            del _edited_characters[character_id]
+            if keep and character_id not in _stale_edited_characters:
+                _character_cache.put(character_id, character)
+                track_equipped_items(character)
+            else:
+                _character_cache.pop(character_id)
+            _stale_edited_characters.discard(character_id)
+
 def set_attribute(user_id: int, attribute_name: str, value: int) -> bool:
     character = get_active_character_by_user_id(user_id)
     if character is None:
@@ -87,14 +492,10 @@ def set_attribute(user_id: int, attribute_name: str, value: int) -> bool:
     attribute = models.stats.get_attribute_by_name(attribute_name)
 
     if attribute is None:
-        raise CharacterException('Invalid attribute name.')
+        raise CharacterException('Invalid attribute name.' + models.stats.did_you_mean(models.stats.suggest_attributes(attribute_name)[:3]))
 
-    cursor = db.conn.cursor()
-    cursor.execute(('INSERT INTO attribute(character_id, attribute_name, value) '
-                    'VALUES (?, ?, ?) ON CONFLICT (character_id, attribute_name) DO UPDATE SET value=?'),
-                    (character.db_id, attribute.name, value, value))
-    cursor.close()
-    db.conn.commit()
+    character.set_attribute(attribute, value)
+    _hold_stat_edits(character, {('attribute', attribute.name): value})
 
 def set_skill(user_id: int, skill_name: str, value: int) -> bool:
     character = get_active_character_by_user_id(user_id)
@@ -104,57 +505,62 @@ def set_skill(user_id: int, skill_name: str, value: int) -> bool:
     skill = models.stats.get_skill_by_name(skill_name)
 
     if skill is None:
-        raise CharacterException('Invalid skill name.')
+        raise CharacterException('Invalid skill name.' + models.stats.did_you_mean(models.stats.suggest_skills(skill_name)[:3]))
 
-    cursor = db.conn.cursor()
-    cursor.execute(('INSERT INTO skill(character_id, skill_name, value) '
-                    'VALUES (?, ?, ?) ON CONFLICT (character_id, skill_name) DO UPDATE SET value=?'),
-                    (character.db_id, skill.name, value, value))
-    cursor.close()
-    db.conn.commit()
+    character.set_skill(skill, value)
+    _hold_stat_edits(character, {('skill', skill.name): value})
     return True
 
-def init_db():
-    # Create a cursor object using the cursor() method
-    cursor = db.conn.cursor()
+def parse_stat_values(spec: str) -> dict:
+    # Reads stat names, each followed by its value, such as "INT 3 PSY 2 logic 2 hand/eye coordination 1".
+    # Names may be abbreviated and contain spaces. A stat given twice keeps its last value.
+    values = {}
+    words = []
+    for token in spec.replace(',', ' ').replace('=', ' ').replace(':', ' ').split():
+        try:
+            value = int(token)
+        except ValueError:
+            words.append(token)
+            continue
 
-    # Create tables if we need to
-    cursor.execute('''CREATE TABLE IF NOT EXISTS character
-                   (id INTEGER PRIMARY KEY, user_id, name, description, image_url, health, morale)''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS attribute
-        (character_id,
-        attribute_name,
-        value,
-        PRIMARY KEY (character_id, attribute_name)
-        CONSTRAINT fk_character
-            FOREIGN KEY (character_id)
-            REFERENCES character (id)
-            ON DELETE CASCADE
-        )''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS skill
-        (character_id,
-        skill_name,
-        value,
-        PRIMARY KEY (character_id, skill_name)
-        CONSTRAINT fk_character
-            FOREIGN KEY (character_id)
-            REFERENCES character (id)
-            ON DELETE CASCADE
-        )''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS active_character
-        (user_id INTEGER PRIMARY KEY,
-        character_id,
-        CONSTRAINT fk_character
-            FOREIGN KEY (character_id)
-            REFERENCES character (id)
-            ON DELETE CASCADE
-        )''')
-    cursor.close()
+        if not words:
+            raise CharacterException(f'Expected a stat name before {value}.')
+        name = ' '.join(words)
+        words.clear()
+
+        stat = models.stats.get_stat_by_name(name)
+        if stat is None:
+            raise CharacterException(f'Invalid stat name: {name}.' + models.stats.did_you_mean(
+                (models.stats.suggest_attributes(name) + models.stats.suggest_skills(name))[:3]))
+        if value < 0 or value > models.stats.MAX_STAT_VALUE:
+            raise CharacterException(f'{models.stats.get_pretty_name(stat)} must be between 0 and {models.stats.MAX_STAT_VALUE}.')
+        values.pop(stat, None)
+        values[stat] = value
+
+    if words:
+        raise CharacterException(f'Missing a value for {" ".join(words)}.')
+    if not values:
+        raise CharacterException('No stats given.')
+    return values
+
+def set_stats(user_id: int, spec: str) -> dict:
+    # Sets any number of attributes and skills of the active character at once, see parse_stat_values().
+    # Nothing is set unless every stat is valid. Returns the values set by stat.
+    values = parse_stat_values(spec)
+
+    character = get_active_character_by_user_id(user_id)
+    if character is None:
+        raise CharacterException('Character not found.')
 
-    # Save (commit) the changes
-    db.conn.commit()
+    edits = {}
+    for stat, value in values.items():
+        if isinstance(stat, Attribute):
+            character.set_attribute(stat, value)
+            edits[('attribute', stat.name)] = value
+        else:
+            character.set_skill(stat, value)
+            edits[('skill', stat.name)] = value
+    _hold_stat_edits(character, edits)
+    return values
 
-init_db()
+db.at_exit(flush_stat_edits)
@@ -1,87 +1,337 @@
-from typing import Optional
-
+import csv
+import io
+import itertools
+import json
+import os
+import threading
+from typing import Optional, TextIO
+
+from models.inventory import InventoryEntry
 from models.item import Item, construct_item
 from models.item_type import ItemType
-from models.itemstat import construct_itemstat
+from models.itemstat import ItemStat, construct_itemstat
+from models.slot import Slot
 import models.stats
 from util.errors import CharacterException, ItemException, PermissionException, StatException
-from util import db
+from util import changelog, db
+from util.cache import AutocompleteCache, LRUCache
 import services.charactersvc
 
 ROUGH_SEARCH_LIMIT = 25
+# Shortest query the trigram index can match anywhere in a name
+_TRIGRAM_LENGTH = 3
+AUTOCOMPLETE_TTL = 30
+
+# Results of the roughly_search_* functions, so a burst of keystrokes costs at most one query
+_item_name_completions = AutocompleteCache(maxsize=4096, ttl=AUTOCOMPLETE_TTL, limit=ROUGH_SEARCH_LIMIT)
+
+# Columns of catalog files, see parse_catalog()
+CATALOG_COLUMNS = ['name', 'description', 'type', 'slot', 'image_url', 'duration', 'stat', 'value', 'stat_description']
+
+_ITEM_COLUMNS = 'item.id, item.user_id, item.name, item.description, item.image_url, item.slot, item.item_type, item.duration, item.version'
+
+ITEM_CACHE_SIZE = int(os.environ.get('BALLROOM_ITEM_CACHE_SIZE', 4096))
+# Number of the most inspected items loaded into the cache at startup
+ITEM_PRELOAD = int(os.environ.get('BALLROOM_ITEM_PRELOAD', 256))
+
+# Items with their effects by id, and item ids by name_key. Cached items are shared, so nothing may change them
+# (Character.equip_item() takes a copy). As in charactersvc, loads only fill the cache if no write to an item
+# happened while they ran, since a reader thread may not see a write waiting for its group commit.
+_items = LRUCache(ITEM_CACHE_SIZE)
+_item_ids = LRUCache(ITEM_CACHE_SIZE)
+_item_cache_lock = threading.Lock()
+_item_generation = 0
+
+# Inspections per item id not yet added to item.inspect_count
+_inspections = {}
+_inspections_lock = threading.Lock()
+
+# Loads items and their effects in one statement, one row per effect.
+# item_stat.item_id has no declared type, and +item.id drops the INTEGER affinity of item.id, which would otherwise
+# be applied to item_stat.item_id in the comparison and keep the primary key of item_stat from being used.
+_LOAD_ITEMS_SQL = (f'SELECT {_ITEM_COLUMNS}, item_stat.item_id, item_stat.stat_name, item_stat.stat_desc, item_stat.value '
+                   'FROM item LEFT JOIN item_stat ON item_stat.item_id = +item.id WHERE {condition}')
+_ITEM_BY_NAME_SQL = _LOAD_ITEMS_SQL.format(condition='item.name_key = ?')
+_ITEM_BY_ID_SQL = _LOAD_ITEMS_SQL.format(condition='item.id = ?')
+_MOST_INSPECTED_ITEMS_SQL = _LOAD_ITEMS_SQL.format(
+    condition='item.id IN (SELECT id FROM item WHERE inspect_count > 0 ORDER BY inspect_count DESC LIMIT ?)')
 
 def create_item(user_id: int, name: str, desc: str, item_type: ItemType) -> Item:
     cursor = db.conn.cursor()
-    cursor.execute('SELECT COUNT() FROM item WHERE name = ?', (name,))
+    cursor.execute('SELECT COUNT() FROM item WHERE name_key = ?', (db.name_key(name),))
     matches = cursor.fetchone()[0]
     if matches != 0:
         cursor.close()
         raise ItemException('An item with the given name already exists.')
 
-    cursor.execute('INSERT INTO item (user_id, name, description, item_type) VALUES (?, ?, ?, ?)', (user_id, name, desc, item_type.name))
+    cursor.execute('INSERT INTO item (user_id, name, name_key, description, item_type) VALUES (?, ?, ?, ?, ?)',
+                   (user_id, name, db.name_key(name), desc, item_type.name))
     item_id = cursor.lastrowid
     cursor.close()
-    db.conn.commit()
+    changelog.record(changelog.ITEM_NAMES)
+    db.commit()
+    # Again once committed, in case a reader thread searched in between
+    _item_name_completions.invalidate(name)
+    db.after_commit(lambda: _item_name_completions.invalidate(name))
     return Item(item_id, user_id, name, None, None, None, item_type, None)
 
+def _load_items(sql: str, params: tuple) -> dict[int, Item]:
+    cursor = db.connection().cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    cursor.close()
+
+    items = {}
+    for row in rows:
+        item = items.get(row[0])
+        if item is None:
+            item = items[row[0]] = construct_item(row[:9])
+        if row[9] is not None:
+            item.effects.append(construct_itemstat(row[9:]))
+    return items
+
+def _remember_items(generation: int, items: dict[int, Item]) -> None:
+    with _item_cache_lock:
+        if generation != _item_generation:
+            return
+        for item in items.values():
+            _items.put(item.db_id, item)
+            _item_ids.put(db.name_key(item.name), item.db_id)
+
+def _invalidate_items(item_ids) -> None:
+    # Drops items after a write, or every item if item_ids is None
+    global _item_generation
+    with _item_cache_lock:
+        _item_generation += 1
+        if item_ids is None:
+            _items.clear()
+            _item_ids.clear()
+            return
+        for item_id in item_ids:
+            _items.pop(item_id)
+
 def find_item_by_name(item_name: str) -> Optional[Item]:
-    cursor = db.conn.cursor()
-    cursor.execute('SELECT * FROM item WHERE name = ?', (item_name,))
-    db_item = cursor.fetchone()
-    if db_item is None:
+    item_id = _item_ids.get(db.name_key(item_name))
+    if item_id is not None:
+        item = _items.get(item_id)
+        if item is not None:
+            return item
+
+    generation = _item_generation
+    items = _load_items(_ITEM_BY_NAME_SQL, (db.name_key(item_name),))
+    _remember_items(generation, items)
+    return next(iter(items.values()), None)
+
+def get_item_by_id(item_id: int) -> Optional[Item]:
+    item = _items.get(item_id)
+    if item is not None:
+        return item
+
+    generation = _item_generation
+    items = _load_items(_ITEM_BY_ID_SQL, (item_id,))
+    _remember_items(generation, items)
+    return items.get(item_id)
+
+def get_cached_item(item_name: str) -> Optional[Item]:
+    # Safe to call from the event loop, as it only reads the cache.
+    # Returns None when find_item_by_name has to run instead.
+    item_id = _item_ids.peek(db.name_key(item_name))
+    if item_id is None:
         return None
+    return _items.peek(item_id)
 
-    item = construct_item(db_item)
-    cursor.execute('SELECT * FROM item_stat WHERE item_id = ?', (item.db_id,))
-    db_item_stats = cursor.fetchall()
-    for row in db_item_stats:
-        item.effects.append(construct_itemstat(row))
+def count_inspection(item: Item) -> None:
+    # Called for every /item inspect, so the most inspected items can be preloaded. Safe from any thread.
+    with _inspections_lock:
+        _inspections[item.db_id] = _inspections.get(item.db_id, 0) + 1
 
-    return item
+def flush_inspections() -> None:
+    global _inspections
+    with _inspections_lock:
+        counts, _inspections = _inspections, {}
+    if not counts:
+        return
 
-# Uses LIKE to search the DB for item names and retrieves the matches.
-def roughly_search_all_item_names(item_name: str) -> Optional[str]:
     cursor = db.conn.cursor()
-    cursor.execute(f'SELECT name FROM item WHERE name LIKE ? LIMIT {ROUGH_SEARCH_LIMIT}', (f'%{item_name}%',))
-    #names = cursor.fetchall()
+    cursor.executemany('UPDATE item SET inspect_count = inspect_count + ? WHERE id = ?',
+                       ((count, item_id) for item_id, count in counts.items()))
+    cursor.close()
+    db.commit()
+
+def preload_items(limit: int = ITEM_PRELOAD) -> int:
+    # Fills the cache with the items inspected most, returning how many were loaded
+    if limit <= 0:
+        return 0
+    generation = _item_generation
+    items = _load_items(_MOST_INSPECTED_ITEMS_SQL, (limit,))
+    _remember_items(generation, items)
+    return len(items)
+
+def cache_stats() -> dict:
+    return {
+        'items': _items.stats(),
+        'item_names': _item_ids.stats(),
+        'item_name_completions': _item_name_completions.stats(),
+    }
+
+def _escape_like(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _search_item_names(item_name: str, user_id: Optional[int]) -> list[str]:
+    owner_filter = '' if user_id is None else 'AND user_id = :user_id'
+    params = {
+        'user_id': user_id,
+        'prefix_start': db.name_key(item_name),
+        'prefix_end': db.name_key(item_name) + '\U0010ffff',
+        'limit': ROUGH_SEARCH_LIMIT,
+    }
+
+    cursor = db.connection().cursor()
+
+    # Prefix matches rank first, and are a range scan on the name_key index (or idx_item_user_name)
+    cursor.execute(('SELECT name FROM item WHERE name_key >= :prefix_start AND name_key < :prefix_end '
+                    f'{owner_filter} ORDER BY name_key LIMIT :limit'), params)
     names = [x[0] for x in cursor.fetchall()]
+
+    # Fill up with matches anywhere in the name. A single user's items are few enough to filter directly.
+    # Across all items the trigram index is needed, so queries shorter than three characters only match prefixes:
+    # scanning every name for rare text would take far too long.
+    if len(names) < ROUGH_SEARCH_LIMIT and (user_id is not None or len(item_name) >= _TRIGRAM_LENGTH):
+        params['limit'] = ROUGH_SEARCH_LIMIT + len(names)
+        if user_id is None:
+            params['phrase'] = '"' + item_name.replace('"', '""') + '"'
+            cursor.execute(('SELECT item.name FROM item_name_fts JOIN item ON item.id = item_name_fts.rowid '
+                            'WHERE item_name_fts MATCH :phrase LIMIT :limit'), params)
+        else:
+            params['pattern'] = f'%{_escape_like(db.name_key(item_name))}%'
+            cursor.execute(("SELECT name FROM item WHERE name_key LIKE :pattern ESCAPE '\\' "
+                            f'{owner_filter} LIMIT :limit'), params)
+
+        prefix_matches = set(names)
+        names.extend(x[0] for x in cursor.fetchall() if x[0] not in prefix_matches)
+
+    cursor.close()
+    return names[:ROUGH_SEARCH_LIMIT]
+
+# Searches all item names for the given text, returning names starting with it first.
+def roughly_search_all_item_names(item_name: str) -> list[str]:
+    names = _search_item_names(item_name, None)
+    # Shorter queries only found prefix matches, which longer queries cannot be filtered from
+    _item_name_completions.put('all', None, item_name, names, complete=len(item_name) >= _TRIGRAM_LENGTH)
     return names
 
-# Filters items by owned user and uses LIKE to search the DB for item names, then retrieves the matches.
-def roughly_search_item_names_by_user(item_name: str, user_id: int) -> Optional[str]:
-    cursor = db.conn.cursor()
-    cursor.execute(f'SELECT name FROM item WHERE user_id = ? AND name LIKE ? LIMIT {ROUGH_SEARCH_LIMIT}', (user_id, f'%{item_name}%'))
-    names = [x[0] for x in cursor.fetchall()]
+# Same as roughly_search_all_item_names, limited to the items owned by the given user.
+def roughly_search_item_names_by_user(item_name: str, user_id: int) -> list[str]:
+    names = _search_item_names(item_name, user_id)
+    _item_name_completions.put('owned', user_id, item_name, names)
     return names
 
+# Answers a search from earlier results without touching the database, if possible.
+# Safe to call from the event loop. Returns None when the search has to run.
+def get_cached_item_names(item_name: str, user_id: Optional[int] = None) -> Optional[list[str]]:
+    if user_id is None:
+        return _item_name_completions.get('all', None, item_name)
+    return _item_name_completions.get('owned', user_id, item_name)
+
 def get_items_owned_by_user(user_id: int) -> Optional[list[Item]]:
-    cursor = db.conn.cursor()
-    cursor.execute('SELECT * FROM item WHERE user_id = ?', (user_id,))
+    cursor = db.connection().cursor()
+    cursor.execute(f'SELECT {_ITEM_COLUMNS} FROM item WHERE user_id = ?', (user_id,))
     output = cursor.fetchall()
     items = []
     for row in output:
-        items.append(Item(*row))
+        items.append(construct_item(row))
     cursor.close()
     return items
 
-def get_character_inventory(user_id: int) -> Optional[dict[Item, int]]:
+def get_inventory_by_character_id(character_id: int) -> list[InventoryEntry]:
+    # Two queries regardless of inventory size: the items with their quantities, then all of their effects.
+    cursor = db.connection().cursor()
+    cursor.execute((f'SELECT {_ITEM_COLUMNS}, inventory.quantity, inventory.equipped '
+                    'FROM inventory JOIN item ON item.id = inventory.item_id WHERE inventory.character_id = ?'),
+                   (character_id,))
+    db_inventory = cursor.fetchall()
+
+    cursor.execute(('SELECT item_stat.item_id, item_stat.stat_name, item_stat.stat_desc, item_stat.value '
+                    'FROM inventory JOIN item_stat ON item_stat.item_id = inventory.item_id '
+                    'WHERE inventory.character_id = ?'),
+                   (character_id,))
+    db_item_stats = cursor.fetchall()
+    cursor.close()
+
+    inventory = []
+    items_by_id = {}
+    for row in db_inventory:
+        item = construct_item(row[:9])
+        items_by_id[item.db_id] = item
+        inventory.append(InventoryEntry(item, row[9], bool(row[10])))
+
+    for row in db_item_stats:
+        items_by_id[row[0]].effects.append(construct_itemstat(row))
+
+    return inventory
+
+def get_character_inventory(user_id: int) -> list[InventoryEntry]:
     character = services.charactersvc.get_active_character_by_user_id(user_id)
     if character is None:
         raise CharacterException('Character not found.')
-    character_id = character.db_id
+    return get_inventory_by_character_id(character.db_id)
+
+def equip_item(user_id: int, item_name: str) -> Optional[Item]:
+    # Equips an item from the active character's inventory, returning the item it replaced
+    character = services.charactersvc.get_active_character_by_user_id(user_id)
+    if character is None:
+        raise CharacterException('Character not found.')
+
+    item = find_item_by_name(item_name)
+    if item is None:
+        raise ItemException('Item not found.')
+
+    if item.slot is None:
+        raise ItemException('That item cannot be equipped.')
+
     cursor = db.conn.cursor()
-    cursor.execute('SELECT item_id, quantity FROM inventory WHERE character_id = ?', (character_id,))
-    db_inventory = cursor.fetchall()
+    cursor.execute('SELECT COUNT(*) FROM inventory WHERE character_id = ? AND item_id = ?', (character.db_id, item.db_id))
+    if cursor.fetchone()[0] == 0:
+        cursor.close()
+        raise ItemException('Your character does not have that item.')
+
+    cursor.execute(('UPDATE inventory SET equipped = 0 WHERE character_id = ? AND equipped '
+                    'AND (SELECT slot FROM item WHERE id = inventory.item_id) = ?'), (character.db_id, item.slot.name))
+    cursor.execute('UPDATE inventory SET equipped = 1 WHERE character_id = ? AND item_id = ?', (character.db_id, item.db_id))
+    cursor.execute('UPDATE character SET version = version + 1 WHERE id = ?', (character.db_id,))
+    cursor.close()
+    changelog.record(changelog.CHARACTER, [character.db_id])
+    db.commit()
 
-    inventory = dict()
-    for inventory_row in db_inventory:
-        cursor.execute('SELECT * FROM item WHERE id = ?', (inventory_row[0],))
-        db_item = cursor.fetchone()
-        item = Item(*db_item)
-        inventory[item] = inventory_row[1]
+    character.version += 1
+    previous = character.equip_item(item)
+    services.charactersvc.invalidate_characters([character.db_id])
+    return previous
 
+def unequip_item(user_id: int, slot: Slot) -> Optional[Item]:
+    character = services.charactersvc.get_active_character_by_user_id(user_id)
+    if character is None:
+        raise CharacterException('Character not found.')
+
+    cursor = db.conn.cursor()
+    cursor.execute(('UPDATE inventory SET equipped = 0 WHERE character_id = ? AND equipped '
+                    'AND (SELECT slot FROM item WHERE id = inventory.item_id) = ?'), (character.db_id, slot.name))
+    cursor.execute('UPDATE character SET version = version + 1 WHERE id = ?', (character.db_id,))
     cursor.close()
-    return inventory
+    changelog.record(changelog.CHARACTER, [character.db_id])
+    db.commit()
+
+    character.version += 1
+    previous = character.unequip_item(slot)
+    services.charactersvc.invalidate_characters([character.db_id])
+    return previous
+
+def _increase_versions(cursor, item_id: int) -> None:
+    # An edited item changes its own sheet and the sheets of every character wearing it
+    cursor.execute('UPDATE item SET version = version + 1 WHERE id = ?', (item_id,))
+    cursor.execute(('UPDATE character SET version = version + 1 '
+                    'WHERE id IN (SELECT character_id FROM inventory WHERE item_id = ? AND equipped)'), (item_id,))
+    changelog.record(changelog.ITEM, [item_id])
 
 def set_attribute(user_id: int, item_name: str, attribute_name: str, value: int, stat_desc: str) -> None:
     item = find_item_by_name(item_name)
@@ -91,10 +341,13 @@ def set_attribute(user_id: int, item_name: str, attribute_name: str, value: int,
     if user_id != item.user_id:
         raise PermissionException('Only the owner of the item may edit its statistics.')
 
+    if abs(value) > models.stats.MAX_STAT_VALUE:
+        raise StatException(f'Effect value must be between -{models.stats.MAX_STAT_VALUE} and {models.stats.MAX_STAT_VALUE}.')
+
     attribute = models.stats.get_attribute_by_name(attribute_name)
 
     if attribute is None:
-        raise StatException('Invalid attribute name.')
+        raise StatException('Invalid attribute name.' + models.stats.did_you_mean(models.stats.suggest_attributes(attribute_name)[:3]))
 
     cursor = db.conn.cursor()
     cursor.execute(('INSERT INTO item_stat(item_id, stat_name, value, stat_desc) '
@@ -104,8 +357,12 @@ def set_attribute(user_id: int, item_name: str, attribute_name: str, value: int,
     if value == 0:
         cursor.execute('DELETE FROM item_stat WHERE item_id = ? AND stat_name = ?', (item.db_id, attribute.name))
 
+    _increase_versions(cursor, item.db_id)
     cursor.close()
-    db.conn.commit()
+    db.commit()
+    _invalidate_items([item.db_id])
+    db.after_commit(lambda: _invalidate_items([item.db_id]))
+    services.charactersvc.update_equipped_item_effect(ItemStat(item.db_id, attribute, stat_desc, value))
 
 def set_skill(user_id: int, item_name: str, skill_name: str, value: int, stat_desc: str) -> None:
     item = find_item_by_name(item_name)
@@ -115,10 +372,13 @@ def set_skill(user_id: int, item_name: str, skill_name: str, value: int, stat_de
     if user_id != item.user_id:
         raise PermissionException('Only the owner of the item may edit its statistics.')
 
+    if abs(value) > models.stats.MAX_STAT_VALUE:
+        raise StatException(f'Effect value must be between -{models.stats.MAX_STAT_VALUE} and {models.stats.MAX_STAT_VALUE}.')
+
     skill = models.stats.get_skill_by_name(skill_name)
 
     if skill is None:
-        raise StatException('Invalid skill name.')
+        raise StatException('Invalid skill name.' + models.stats.did_you_mean(models.stats.suggest_skills(skill_name)[:3]))
 
     cursor = db.conn.cursor()
     cursor.execute(('INSERT INTO item_stat(item_id, stat_name, value, stat_desc) '
@@ -128,50 +388,189 @@ def set_skill(user_id: int, item_name: str, skill_name: str, value: int, stat_de
     if value == 0:
         cursor.execute('DELETE FROM item_stat WHERE item_id = ? AND stat_name = ?', (item.db_id, skill.name))
 
+    _increase_versions(cursor, item.db_id)
     cursor.close()
-    db.conn.commit()
+    db.commit()
+    _invalidate_items([item.db_id])
+    db.after_commit(lambda: _invalidate_items([item.db_id]))
+    services.charactersvc.update_equipped_item_effect(ItemStat(item.db_id, skill, stat_desc, value))
+
+def parse_catalog(data: bytes, fmt: str) -> list[dict]:
+    # Reads a catalog file into entries with a row number, the item's columns and a list of effects.
+    # JSON files hold a list of items whose effects are a list of (stat, value, description) objects.
+    # CSV files have a header of CATALOG_COLUMNS, and rows after the first one of an item only add effects.
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ItemException('Catalogs must be UTF-8 text.')
+
+    if fmt == 'json':
+        try:
+            items = json.loads(text)
+        except ValueError as e:
+            raise ItemException(f'Invalid JSON: {e}')
+        if not isinstance(items, list) or not all(isinstance(x, dict) for x in items):
+            raise ItemException('The JSON file must hold a list of items.')
+        return [{ **x, 'row': i + 1, 'effects': x.get('effects') or [] } for i, x in enumerate(items)]
+
+    if fmt != 'csv':
+        raise ItemException('Catalogs must be JSON or CSV files.')
+
+    reader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames is None or 'name' not in reader.fieldnames:
+        raise ItemException(f'The CSV file must have a header row with the columns: {", ".join(CATALOG_COLUMNS)}')
+
+    entries = []
+    entries_by_name = {}
+    for row in reader:
+        key = db.name_key(row['name'] or '')
+        entry = entries_by_name.get(key)
+        if entry is None:
+            entry = entries_by_name[key] = { **row, 'row': reader.line_num, 'effects': [] }
+            entries.append(entry)
+        if row.get('stat'):
+            entry['effects'].append({ 'stat': row['stat'], 'value': row.get('value'), 'description': row.get('stat_description') })
+    return entries
+
+def _validate_catalog_entry(entry: dict) -> tuple[tuple, dict]:
+    # Returns the item's columns and its effects by stat name, or raises with what is wrong
+    name = str(entry.get('name') or '').strip()
+    if not name:
+        raise ItemException('Missing name.')
+
+    try:
+        item_type = ItemType[str(entry.get('type') or '').strip().upper()]
+    except KeyError:
+        raise ItemException(f'Invalid item type. Valid options are: {", ".join(ItemType.__members__.keys())}')
+
+    slot = str(entry.get('slot') or '').strip().upper() or None
+    if slot is not None and slot not in Slot.__members__:
+        raise ItemException(f'Invalid slot. Valid options are: {", ".join(Slot.__members__.keys())}')
+
+    duration = entry.get('duration')
+    if duration in ('', None):
+        duration = None
+    else:
+        try:
+            duration = int(duration)
+        except (TypeError, ValueError):
+            raise ItemException('Duration must be a whole number.')
+
+    image_url = entry.get('image_url') or None
+    if image_url is not None and not isinstance(image_url, str):
+        raise ItemException('The image URL must be text.')
+
+    if not isinstance(entry['effects'], list) or not all(isinstance(x, dict) for x in entry['effects']):
+        raise ItemException('Effects must be a list of objects with a stat, a value and a description.')
+    effects = {}
+    for effect in entry['effects']:
+        stat_name = str(effect.get('stat') or '')
+        stat = models.stats.get_stat_by_name(stat_name)
+        if stat is None:
+            suggestions = models.stats.suggest_attributes(stat_name) + models.stats.suggest_skills(stat_name)
+            raise StatException(f'Invalid stat name {stat_name!r}.' + models.stats.did_you_mean(suggestions[:3]))
+        try:
+            value = int(effect.get('value'))
+        except (TypeError, ValueError):
+            raise StatException(f'The value of {models.stats.get_pretty_name(stat)} must be a whole number.')
+        if abs(value) > models.stats.MAX_STAT_VALUE:
+            raise StatException(f'Effect value must be between -{models.stats.MAX_STAT_VALUE} and {models.stats.MAX_STAT_VALUE}.')
+        if value != 0:
+            effects[stat.name] = (str(effect.get('description') or ''), value)
+
+    item = (name, db.name_key(name), str(entry.get('description') or ''), image_url, slot, item_type.name, duration)
+    return item, effects
+
+def import_items(user_id: int, entries: list[dict]) -> tuple[int, list[str]]:
+    # Adds every valid entry of a parsed catalog in one transaction, owned by user_id.
+    # Returns how many items were added and an error message for each entry that was skipped.
+    errors = []
+    items = []
+    keys = set()
+    for entry in entries:
+        label = f'Row {entry["row"]}' + (f' ({entry["name"]})' if entry.get('name') else '')
+        try:
+            item, effects = _validate_catalog_entry(entry)
+        except (ItemException, StatException) as e:
+            errors.append(f'{label}: {e}')
+            continue
+        if item[1] in keys:
+            errors.append(f'{label}: The name appears more than once.')
+            continue
+        keys.add(item[1])
+        items.append((label, item, effects))
 
-def init_db():
-    # Create a cursor object using the cursor() method
     cursor = db.conn.cursor()
-
-    # Create tables if we need to
-    cursor.execute('''CREATE TABLE IF NOT EXISTS item
-                   (id INTEGER PRIMARY KEY, user_id NOT NULL, name COLLATE UNICODE_NOCASE NOT NULL UNIQUE, description NOT NULL, image_url, slot, item_type NOT NULL, duration)''')
-
-    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_name ON item (name);''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS item_stat
-        (item_id NOT NULL,
-        stat_name NOT NULL,
-        stat_desc NOT NULL,
-        value NOT NULL,
-        PRIMARY KEY (item_id, stat_name)
-        CONSTRAINT fk_item
-            FOREIGN KEY (item_id)
-            REFERENCES item (id)
-            ON DELETE CASCADE
-        )''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS inventory
-        (character_id,
-        item_id,
-        quantity,
-        equipped,
-        PRIMARY KEY (character_id, item_id)
-        CONSTRAINT fk_character
-            FOREIGN KEY (character_id)
-            REFERENCES character (id)
-            ON DELETE CASCADE
-        CONSTRAINT fk_item
-            FOREIGN KEY (item_id)
-            REFERENCES item (id)
-            ON DELETE CASCADE
-        )''')
-
+    existing = set()
+    key_list = list(keys)
+    for i in range(0, len(key_list), 500):
+        chunk = key_list[i:i + 500]
+        cursor.execute(f'SELECT name_key FROM item WHERE name_key IN ({", ".join("?" * len(chunk))})', chunk)
+        existing.update(x[0] for x in cursor.fetchall())
+
+    errors.extend(f'{label}: An item with the given name already exists.' for label, item, _ in items if item[1] in existing)
+    items = [x for x in items if x[1][1] not in existing]
+
+    # Ids are handed out here so the effects can be inserted in bulk too. They stay free because only the DB worker
+    # writes, and other bot processes sharing the database wait for the write lock taken first.
+    if not db.conn.in_transaction:
+        cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM item')
+    first_id = cursor.fetchone()[0] + 1
+    cursor.executemany(('INSERT INTO item (id, user_id, name, name_key, description, image_url, slot, item_type, duration) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'),
+                       ((first_id + i, user_id, *item) for i, (_, item, _) in enumerate(items)))
+    cursor.executemany('INSERT INTO item_stat (item_id, stat_name, stat_desc, value) VALUES (?, ?, ?, ?)',
+                       ((first_id + i, stat_name, desc, value) for i, (_, _, effects) in enumerate(items)
+                        for stat_name, (desc, value) in effects.items()))
+    cursor.close()
+    if items:
+        changelog.record(changelog.ITEM_NAMES)
+    db.commit()
+
+    if items:
+        _item_name_completions.clear()
+        db.after_commit(_item_name_completions.clear)
+    return len(items), errors
+
+def export_items(out: TextIO, fmt: str) -> int:
+    # Writes the catalog to out as parse_catalog() reads it, one item at a time, and returns the number of items
+    cursor = db.connection().cursor()
+    cursor.execute(('SELECT item.id, item.name, item.description, item.item_type, item.slot, item.image_url, item.duration, '
+                    'item_stat.stat_name, item_stat.value, item_stat.stat_desc '
+                    'FROM item LEFT JOIN item_stat ON item_stat.item_id = item.id ORDER BY item.id'))
+
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(CATALOG_COLUMNS)
+    else:
+        out.write('[')
+
+    count = 0
+    for _, rows in itertools.groupby(cursor, key=lambda x: x[0]):
+        rows = list(rows)
+        _, name, description, item_type, slot, image_url, duration = rows[0][:7]
+        effects = [x[7:] for x in rows if x[7] is not None]
+        if writer is not None:
+            for stat_name, value, desc in effects or [(None, None, None)]:
+                writer.writerow([name, description, item_type, slot, image_url, duration, stat_name, value, desc])
+        else:
+            out.write(',\n' if count else '\n')
+            out.write(json.dumps({
+                'name': name, 'description': description, 'type': item_type, 'slot': slot, 'image_url': image_url,
+                'duration': duration,
+                'effects': [{ 'stat': stat_name, 'value': value, 'description': desc } for stat_name, value, desc in effects],
+            }))
+        count += 1
+
+    if writer is None:
+        out.write('\n]\n')
     cursor.close()
+    return count
 
-    # Save (commit) the changes
-    db.conn.commit()
+# Items added or changed by other bot processes
+changelog.subscribe(changelog.ITEM_NAMES, lambda _: _item_name_completions.clear())
+changelog.subscribe(changelog.ITEM, _invalidate_items)
 
-init_db()
+db.at_exit(flush_inspections)
@@ -0,0 +1,106 @@
+import functools
+import random
+
+from models.character import Character
+from models.difficulty import Difficulty
+from models.roll import RollResult
+from models.skill import Skill
+from util.errors import CharacterException
+import services.charactersvc
+
+# Checks are 2d6 + effective skill against the difficulty.
+# Double sixes always succeed and double ones always fail.
+DICE_COUNT = 2
+DICE_SIDES = 6
+
+_rng = random.Random()
+_faces = range(1, DICE_SIDES + 1)
+
+def roll_dice(count: int) -> list[int]:
+    # All the dice needed for a batch of checks, drawn in one call
+    return _rng.choices(_faces, k=count)
+
+@functools.cache
+def dice_distribution(count: int, sides: int) -> tuple[int, ...]:
+    # Number of ways to roll each sum with count dice, indexed by the sum. Built by repeated convolution.
+    ways = [1]
+    for _ in range(count):
+        convolved = [0] * (len(ways) + sides)
+        for total, n in enumerate(ways):
+            for face in range(1, sides + 1):
+                convolved[total + face] += n
+        ways = convolved
+    return tuple(ways)
+
+@functools.cache
+def _success_table(count: int, sides: int) -> tuple[float, ...]:
+    # Chance to succeed, indexed by the dice sum needed (clamped to 0..count * sides + 1)
+    ways = dice_distribution(count, sides)
+    outcomes = sides ** count
+    table = []
+    at_least = outcomes
+    for needed in range(count * sides + 2):
+        if needed > 0:
+            at_least -= ways[needed - 1]
+        successes = at_least
+        if needed <= count:
+            successes -= 1  # all ones always fail
+        if needed > count * sides:
+            successes += 1  # all sixes always succeed
+        table.append(successes / outcomes)
+    return tuple(table)
+
+def success_probability(skill_value: int, target: int, modifier: int = 0) -> float:
+    table = _success_table(DICE_COUNT, DICE_SIDES)
+    needed = min(max(target - skill_value - modifier, 0), len(table) - 1)
+    return table[needed]
+
+def get_odds(user_id: int, skill: Skill, difficulty: Difficulty, modifier: int = 0) -> float:
+    character = services.charactersvc.get_active_character_by_user_id(user_id)
+    if character is None:
+        raise CharacterException('Character not found.')
+    return success_probability(character.get_effective_skill(skill), difficulty.value, modifier)
+
+def get_skill_odds(user_id: int, skill: Skill, difficulties: list[Difficulty], modifier: int = 0) -> dict[Difficulty, float]:
+    # Chance of success against each of the difficulties, in the order given, with one character lookup
+    character = services.charactersvc.get_active_character_by_user_id(user_id)
+    if character is None:
+        raise CharacterException('Character not found.')
+    skill_value = character.get_effective_skill(skill)
+    return { difficulty: success_probability(skill_value, difficulty.value, modifier) for difficulty in difficulties }
+
+def get_all_odds(user_id: int, difficulty: Difficulty, modifier: int = 0) -> dict[Skill, float]:
+    # Chance of success for every skill of the active character, in Skill enum order
+    character = services.charactersvc.get_active_character_by_user_id(user_id)
+    if character is None:
+        raise CharacterException('Character not found.')
+    return { skill: success_probability(value, difficulty.value, modifier)
+             for skill, value in zip(Skill, character.get_effective_skills()) }
+
+def resolve_check(character: Character, skill: Skill, difficulty: Difficulty, dice: tuple[int, ...], modifier: int = 0) -> RollResult:
+    skill_value = character.get_effective_skill(skill)
+    total = sum(dice) + skill_value + modifier
+
+    critical = all(x == DICE_SIDES for x in dice) or all(x == 1 for x in dice)
+    if critical:
+        success = dice[0] == DICE_SIDES
+    else:
+        success = total >= difficulty.value
+
+    return RollResult(character, skill, difficulty, dice, skill_value, modifier, total, success, critical)
+
+def roll_checks(characters: list[Character], skill: Skill, difficulty: Difficulty, modifier: int = 0) -> list[RollResult]:
+    dice = roll_dice(DICE_COUNT * len(characters))
+    return [resolve_check(character, skill, difficulty, tuple(dice[i * DICE_COUNT:(i + 1) * DICE_COUNT]), modifier)
+            for i, character in enumerate(characters)]
+
+def roll_skill(user_id: int, skill: Skill, difficulty: Difficulty, modifier: int = 0) -> RollResult:
+    character = services.charactersvc.get_active_character_by_user_id(user_id)
+    if character is None:
+        raise CharacterException('Character not found.')
+    return roll_checks([character], skill, difficulty, modifier)[0]
+
+def roll_skill_for_users(user_ids: list[int], skill: Skill, difficulty: Difficulty) -> list[RollResult]:
+    # One check per user with an active character, in the order given. Everyone is loaded in a single query.
+    characters = services.charactersvc.get_active_characters_by_user_ids(user_ids)
+    return roll_checks([characters[x] for x in dict.fromkeys(user_ids) if x in characters], skill, difficulty)
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from util.db import name_key
+
+class LRUCache:
+    # Shared by the DB worker, the reader threads and the event loop, so every operation takes the lock
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._entries))
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        # Like get(), without touching recency or the hit/miss counters
+        return self._entries.get(key, default)
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+class AutocompleteCache:
+    # Search results keyed by (scope, user id, query) that expire after ttl seconds.
+    # A result with fewer than limit names holds every match, so a longer query starting
+    # with the same text can be answered by filtering it instead of searching again.
+    # Results put with complete=False may miss matches and only answer their own query.
+    # match_anywhere says whether the search matches the query anywhere in a name or only at its start,
+    # so filtered results are the same as a search would return.
+    # Filled on the DB threads and read from the event loop, hence the lock.
+    def __init__(self, maxsize: int, ttl: float, limit: int, match_anywhere: bool = True) -> None:
+        self.ttl = ttl
+        self.limit = limit
+        self.match_anywhere = match_anywhere
+        self._entries = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, scope: str, user_id: Optional[int], query: str) -> Optional[list[str]]:
+        key = name_key(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((scope, user_id, key))
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+            for length in range(len(key) - 1, -1, -1):
+                entry = self._entries.peek((scope, user_id, key[:length]))
+                if entry is None or entry[0] <= now or not entry[2] or len(entry[1]) >= self.limit:
+                    continue
+
+                names = [x for x in entry[1] if name_key(x).startswith(key)]
+                if self.match_anywhere:
+                    names.extend(x for x in entry[1] if key in name_key(x) and not name_key(x).startswith(key))
+                self._entries.put((scope, user_id, key), (entry[0], names, True))
+                return names
+
+        return None
+
+    def put(self, scope: str, user_id: Optional[int], query: str, names: list[str], complete: bool = True) -> None:
+        with self._lock:
+            self._entries.put((scope, user_id, name_key(query)), (time.monotonic() + self.ttl, names, complete))
+
+    def invalidate(self, name: str) -> None:
+        # Drops every result the given (new or changed) name could belong to
+        key = name_key(name)
+        with self._lock:
+            for entry_key in [x for x in self._entries if x[2] in key]:
+                self._entries.pop(entry_key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return self._entries.stats()
@@ -0,0 +1,102 @@
+import logging
+import os
+import random
+import time
+
+from util import db
+
+_log = logging.getLogger(__name__)
+
+# Keeps the caches of several bot processes sharing one database file coherent.
+# Writes record what they changed in the change_log table, in the same transaction, and each process polls for
+# rows written by the others. Polling is cheap: PRAGMA data_version only changes when another connection commits.
+
+POLL_MS = float(os.environ.get('BALLROOM_CHANGE_POLL_MS', 250))
+
+# Rows kept in change_log. A process that falls further behind (it was paused, say) drops all of its caches.
+KEEP_ROWS = int(os.environ.get('BALLROOM_CHANGE_LOG_ROWS', 100_000))
+PRUNE_INTERVAL = 60
+
+# Tells this process's rows from those of the others
+ORIGIN = random.getrandbits(62)
+
+# Kinds of change, each with the key it records:
+CHARACTER = 'character'           # character id, for any change to the character, its stats or what it wears
+ACTIVE_CHARACTER = 'active'       # user id, for a change of active character
+ITEM = 'item'                     # item id, for a change to the item or its effects
+ITEM_NAMES = 'item_names'         # no key, for items being added
+CHARACTER_NAMES = 'character_names'  # no key, for characters being added
+
+# Kind -> functions called with the keys changed by other processes, or None if everything may have changed
+_handlers = {}
+
+_started = False
+_last_id = 0
+_data_version = None
+_next_prune = 0.0
+
+def subscribe(kind: str, func) -> None:
+    _handlers.setdefault(kind, []).append(func)
+
+def record(kind: str, keys=(None,)) -> None:
+    # Call before committing a write that changes what kind describes. Does nothing unless start() was called.
+    if not _started:
+        return
+    db.conn.executemany('INSERT INTO change_log (origin, kind, key) VALUES (?, ?, ?)',
+                        ((ORIGIN, kind, key) for key in keys))
+
+def _notify(kind: str, keys) -> None:
+    for func in _handlers.get(kind, ()):
+        try:
+            func(keys)
+        except Exception:
+            _log.exception('Change handler %r failed', func)
+
+def start() -> None:
+    # Starts recording changes and polling for those of other processes. Run on the worker, after migrating.
+    global _started, _last_id, _data_version
+    if _started:
+        return
+    _started = True
+    _last_id = db.conn.execute('SELECT COALESCE(MAX(id), 0) FROM change_log').fetchone()[0]
+    _data_version = db.conn.execute('PRAGMA data_version').fetchone()[0]
+    db.defer('change_log', poll, POLL_MS / 1000)
+
+def poll() -> None:
+    global _last_id, _data_version, _next_prune
+    if not _started or db.closing():
+        return
+    db.defer('change_log', poll, POLL_MS / 1000)
+
+    data_version = db.conn.execute('PRAGMA data_version').fetchone()[0]
+    if data_version == _data_version:
+        return
+    _data_version = data_version
+
+    cursor = db.conn.cursor()
+    cursor.execute('SELECT MIN(id) FROM change_log')
+    first_id = cursor.fetchone()[0]
+    cursor.execute('SELECT id, origin, kind, key FROM change_log WHERE id > ? ORDER BY id', (_last_id,))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    if first_id is not None and first_id > _last_id + 1:
+        # Rows this process never saw were pruned
+        _log.warning('Fell behind the change log, dropping all cached data')
+        for kind in _handlers:
+            _notify(kind, None)
+    else:
+        changes = {}
+        for _, origin, kind, key in rows:
+            if origin != ORIGIN:
+                changes.setdefault(kind, set()).add(key)
+        for kind, keys in changes.items():
+            _notify(kind, keys)
+
+    if rows:
+        _last_id = rows[-1][0]
+
+    if time.monotonic() >= _next_prune:
+        _next_prune = time.monotonic() + PRUNE_INTERVAL
+        db.conn.execute('DELETE FROM change_log WHERE id <= ?', (_last_id - KEEP_ROWS,))
+        db.commit()
@@ -1,8 +1,45 @@
+import asyncio
 import atexit
+import contextvars
+import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
+import pathlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
 
-#conn = sqlite3.connect('ballroom.db')
+_log = logging.getLogger(__name__)
 
+# Path of the database file. Use ':memory:' for a throwaway database.
+DATABASE_PATH = os.environ.get('BALLROOM_DB', 'ballroom.db')
+
+# Tuning pragmas, see https://www.sqlite.org/pragma.html
+SYNCHRONOUS = os.environ.get('BALLROOM_DB_SYNCHRONOUS', 'NORMAL')
+CACHE_SIZE = int(os.environ.get('BALLROOM_DB_CACHE_SIZE', -64 * 1024))  # negative means KiB
+MMAP_SIZE = int(os.environ.get('BALLROOM_DB_MMAP_SIZE', 256 * 1024 * 1024))
+
+# Writes committed within this many milliseconds of each other share a single transaction (and fsync).
+# Set to 0 to commit every write on its own.
+GROUP_COMMIT_MS = float(os.environ.get('BALLROOM_GROUP_COMMIT_MS', 5))
+GROUP_COMMIT_MAX_WRITES = 256
+
+# Threads with their own read-only connection for read(). File-backed databases only; 0 sends reads to the worker.
+READERS = int(os.environ.get('BALLROOM_DB_READERS', 4))
+
+def name_key(name: str) -> str:
+    # Case-insensitive lookup key stored next to user-provided names
+    return name.casefold()
+
+def ensure_column(cursor, table: str, column: str, definition: str) -> None:
+    # Adds a column that databases created by older versions of the bot lack
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in (x[1] for x in cursor.fetchall()):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+# Only needed to open databases created before names had a name_key column
 def unicode_nocase_collation(a: str, b: str):
     if a.casefold() == b.casefold():
         return 0
@@ -10,10 +47,325 @@ def unicode_nocase_collation(a: str, b: str):
         return -1
     return 1
 
-conn = sqlite3.connect(':memory:')
-conn.create_collation("UNICODE_NOCASE", unicode_nocase_collation)
+def _connect(path: str) -> sqlite3.Connection:
+    # The connection is owned by the DB worker thread below once the bot is running.
+    # check_same_thread is off so the migrations and scripts can use it from the main thread before the bot runs.
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.create_collation("UNICODE_NOCASE", unicode_nocase_collation)
+
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.execute(f'PRAGMA synchronous = {SYNCHRONOUS}')
+    connection.execute(f'PRAGMA cache_size = {CACHE_SIZE}')
+    connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    connection.set_trace_callback(_trace_callback)
+    return connection
+
+# Called with the text of every statement the connection runs, see set_trace_callback()
+_trace_callback = None
+
+conn = _connect(DATABASE_PATH)
+
+def open_database(path: str) -> None:
+    # Points the module at another database file. Only meant to be used before the bot starts.
+    global conn, DATABASE_PATH
+    call(_settle)
+    _close_readers()
+    conn.close()
+    DATABASE_PATH = path
+    conn = _connect(path)
+
+def set_trace_callback(callback) -> None:
+    # Installs callback on the current connections and on any connection opened later
+    global _trace_callback
+    _trace_callback = callback
+    call(conn.set_trace_callback, callback)
+    with _readers_lock:
+        for connection in _reader_connections:
+            connection.set_trace_callback(callback)
+
+# Readers see the database as of the last commit, so with WAL they never wait for the writer (or it for them).
+_readers = None
+_readers_lock = threading.Lock()
+_reader_connections = []
+_local = threading.local()
+
+def _is_file_database(path: str) -> bool:
+    return path not in ('', ':memory:') and not path.startswith('file:')
+
+def _open_reader() -> None:
+    uri = pathlib.Path(DATABASE_PATH).absolute().as_uri() + '?mode=ro'
+    connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    connection.create_collation("UNICODE_NOCASE", unicode_nocase_collation)
+    connection.execute(f'PRAGMA cache_size = {CACHE_SIZE}')
+    connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    connection.set_trace_callback(_trace_callback)
+    _local.conn = connection
+    with _readers_lock:
+        _reader_connections.append(connection)
+
+def _reader_pool() -> Optional[ThreadPoolExecutor]:
+    global _readers
+    if _readers is None and READERS > 0 and _is_file_database(DATABASE_PATH) and not _closed:
+        with _readers_lock:
+            if _readers is None:
+                _readers = ThreadPoolExecutor(READERS, thread_name_prefix='ballroom-db-read', initializer=_open_reader)
+    return _readers
+
+def _close_readers() -> None:
+    global _readers
+    if _readers is not None:
+        _readers.shutdown()
+        _readers = None
+    with _readers_lock:
+        for connection in _reader_connections:
+            connection.close()
+        _reader_connections.clear()
+
+def connection() -> sqlite3.Connection:
+    # The connection for the current thread: its own on a reader thread, otherwise the writer connection.
+    # Functions that only read use this, so they can run through read() as well as run().
+    return getattr(_local, 'conn', None) or conn
+
+# All service calls made from the event loop are funneled through a single worker thread,
+# so a slow query or fsync never blocks the loop (and with it the gateway heartbeat).
+_jobs = queue.SimpleQueue()
+
+# Work the worker runs once it is due, keyed so repeated requests coalesce: key -> (deadline, func)
+_deferred = {}
+
+# Set by commit() while a job runs on the worker; futures of those jobs wait for the group commit.
+_commit_requested = False
+_awaiting_commit = []
+# (func, on_rollback) pairs registered by after_commit() for the writes waiting for the group commit
+_after_commit = []
+
+# Called with the seconds each job ran on the worker, in the context of the code that submitted the job
+job_observer = None
+
+def _run_deferred(force: bool = False) -> None:
+    global _commit_requested
+    now = time.monotonic()
+    for key, (deadline, func) in list(_deferred.items()):
+        if force or deadline <= now:
+            del _deferred[key]
+            _commit_requested = False
+            try:
+                _run_isolated(func)
+            except Exception:
+                _log.exception('Deferred database work %r failed', key)
+            # Deferred work that writes joins the next group commit, like a job
+            if _commit_requested:
+                _commit_requested = False
+                defer('commit', _group_commit, GROUP_COMMIT_MS / 1000)
+
+def _next_timeout() -> Optional[float]:
+    if not _deferred:
+        return None
+    return max(0.0, min(deadline for deadline, _ in _deferred.values()) - time.monotonic())
+
+def _run_callbacks(callbacks: list, committed: bool) -> None:
+    for on_commit, on_rollback in callbacks:
+        func = on_commit if committed else on_rollback
+        if func is None:
+            continue
+        try:
+            func()
+        except Exception:
+            _log.exception('After-commit callback %r failed', func)
+
+def _group_commit() -> None:
+    global _awaiting_commit, _after_commit
+    waiting, _awaiting_commit = _awaiting_commit, []
+    callbacks, _after_commit = _after_commit, []
+
+    try:
+        conn.commit()
+    except BaseException as e:
+        conn.rollback()
+        _run_callbacks(callbacks, committed=False)
+        for future, _ in waiting:
+            future.set_exception(e)
+        return
+
+    _run_callbacks(callbacks, committed=True)
+    for future, result in waiting:
+        future.set_result(result)
+
+def _end_savepoint(rollback: bool) -> None:
+    try:
+        if rollback:
+            conn.execute('ROLLBACK TO job')
+        conn.execute('RELEASE job')
+    except sqlite3.OperationalError:
+        # The job ended the transaction itself, as migrate() does, so only its uncommitted writes are left
+        if rollback and conn.in_transaction:
+            conn.rollback()
+
+def _run_isolated(func, *args, **kwargs):
+    # Runs func so that if it raises, its writes are undone, while those of earlier jobs still waiting for
+    # the group commit in the same transaction are kept. Of the after-commit callbacks it registered,
+    # only the rollback ones run.
+    savepoint = conn.in_transaction
+    callbacks = len(_after_commit)
+    if savepoint:
+        conn.execute('SAVEPOINT job')
+    try:
+        result = func(*args, **kwargs)
+    except BaseException:
+        failed = _after_commit[callbacks:]
+        del _after_commit[callbacks:]
+        if savepoint:
+            _end_savepoint(rollback=True)
+        elif conn.in_transaction:
+            conn.rollback()
+        _run_callbacks(failed, committed=False)
+        raise
+
+    if savepoint:
+        _end_savepoint(rollback=False)
+    return result
+
+def _run_job(job) -> None:
+    global _commit_requested
+    future, context, func, args, kwargs = job
+    if not future.set_running_or_notify_cancel():
+        return
+
+    _commit_requested = False
+    start = time.perf_counter()
+    try:
+        result = context.run(_run_isolated, func, *args, **kwargs)
+    except BaseException as e:
+        future.set_exception(e)
+        return
+    finally:
+        if job_observer is not None:
+            context.run(job_observer, time.perf_counter() - start)
+
+    if not _commit_requested:
+        future.set_result(result)
+        return
+
+    # Hold the result back until the write is durable.
+    _awaiting_commit.append((future, result))
+    if len(_awaiting_commit) >= GROUP_COMMIT_MAX_WRITES:
+        _deferred.pop('commit', None)
+        _group_commit()
+    else:
+        defer('commit', _group_commit, GROUP_COMMIT_MS / 1000)
+
+def _settle() -> None:
+    # Runs all deferred work now, including writes held back by the services, and commits
+    _run_deferred(force=True)
+    _deferred.pop('commit', None)
+    _group_commit()
+
+def _worker_main() -> None:
+    while True:
+        try:
+            job = _jobs.get(timeout=_next_timeout())
+        except queue.Empty:
+            job = ()
+
+        if job is None:
+            while _deferred:
+                _run_deferred(force=True)
+            return
+
+        if job:
+            _run_job(job)
+        _run_deferred()
+
+_worker = threading.Thread(target=_worker_main, name='ballroom-db', daemon=True)
+_worker.start()
+
+def on_worker_thread() -> bool:
+    return threading.current_thread() is _worker
+
+def defer(key: str, func, delay: float) -> None:
+    # Schedules func to run on the worker after delay seconds, unless it is already scheduled under key.
+    # Must be called from the worker thread.
+    if key not in _deferred:
+        _deferred[key] = (time.monotonic() + delay, func)
+
+def commit() -> None:
+    global _commit_requested
+    if GROUP_COMMIT_MS <= 0 or not on_worker_thread():
+        conn.commit()
+        return
+    _commit_requested = True
+
+def after_commit(func, on_rollback=None) -> None:
+    # Runs func once the write just made is committed: right away, unless it is waiting for a group commit.
+    # Readers cannot see a write before then, so caches they fill are invalidated again at that point.
+    # If the write is rolled back instead, on_rollback runs in its place, if given. Cache invalidation needs
+    # none, unless cached objects were changed in place before the commit.
+    if on_worker_thread() and _commit_requested:
+        _after_commit.append((func, on_rollback))
+    else:
+        func()
+
+def closing() -> bool:
+    # True once app_exit() has started, for deferred work that schedules itself again
+    return _closed
+
+def at_exit(func) -> None:
+    # Registers func to run on the worker when the bot shuts down, before the last commit.
+    # For services that hold writes back, so they can write them out.
+    _exit_handlers.append(func)
+
+def submit(func, *args, **kwargs) -> Future:
+    # Jobs run in a copy of the caller's context, so context variables set by the caller are visible to them
+    future = Future()
+    _jobs.put((future, contextvars.copy_context(), func, args, kwargs))
+    return future
+
+def call(func, *args, **kwargs):
+    # Blocking variant of run() for code that is not on the event loop
+    if on_worker_thread() or not _worker.is_alive():
+        return func(*args, **kwargs)
+    return submit(func, *args, **kwargs).result()
+
+async def run(func, *args, **kwargs):
+    return await asyncio.wrap_future(submit(func, *args, **kwargs))
+
+def _run_read(func, args, kwargs):
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if job_observer is not None:
+            job_observer(time.perf_counter() - start)
+
+def submit_read(func, *args, **kwargs) -> Future:
+    # Runs func on a reader thread, or on the worker if there are none. func must not write.
+    pool = _reader_pool()
+    if pool is None:
+        return submit(func, *args, **kwargs)
+    return pool.submit(contextvars.copy_context().run, _run_read, func, args, kwargs)
+
+async def read(func, *args, **kwargs):
+    return await asyncio.wrap_future(submit_read(func, *args, **kwargs))
+
+_closed = False
+_exit_handlers = []
 
 def app_exit():
+    global _closed
+    if _closed:
+        return
+    _closed = True
+
+    for func in _exit_handlers:
+        try:
+            call(func)
+        except Exception:
+            _log.exception('Exit handler %r failed', func)
+    _close_readers()
+    if _worker.is_alive():
+        _jobs.put(None)
+        _worker.join()
     conn.commit()
     conn.close()
 
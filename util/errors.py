@@ -9,3 +9,6 @@ class ItemException(Exception):
 
 class PermissionException(Exception):
     pass
+
+class SchemaException(Exception):
+    pass
@@ -0,0 +1,150 @@
+import functools
+import json
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+from discord import app_commands
+
+from util import db
+
+# Where the metrics are written every METRICS_INTERVAL seconds. Set BALLROOM_METRICS_FILE to an empty string to disable.
+METRICS_FILE = os.environ.get('BALLROOM_METRICS_FILE', 'ballroom-metrics.json')
+METRICS_INTERVAL = float(os.environ.get('BALLROOM_METRICS_INTERVAL', 60))
+
+# Percentiles are computed over this many of the most recent calls of each handler
+SAMPLE_SIZE = 1024
+
+class Histogram:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.query_time = 0.0
+        self._samples = deque(maxlen=SAMPLE_SIZE)
+
+    def record(self, elapsed: float, failed: bool, queries: int, query_time: float) -> None:
+        self.calls += 1
+        self.errors += failed
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.query_time += query_time
+        self._samples.append(elapsed)
+
+    def summary(self) -> dict:
+        ordered = sorted(self._samples)
+        def at(pct: float) -> float:
+            return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] * 1000 if ordered else 0.0
+
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'p50_ms': at(50),
+            'p95_ms': at(95),
+            'p99_ms': at(99),
+            'max_ms': self.max_time * 1000,
+            'total_ms': self.total_time * 1000,
+            'queries_per_call': self.queries / self.calls if self.calls else 0.0,
+            'max_queries': self.max_queries,
+            'query_ms_per_call': self.query_time * 1000 / self.calls if self.calls else 0.0,
+        }
+
+class _Interaction:
+    # Database work done on behalf of one command or autocomplete call
+    __slots__ = ('queries', 'query_time')
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.query_time = 0.0
+
+# Handler name -> Histogram. Only touched on the event loop.
+_histograms = {}
+
+# The interaction being handled. Jobs submitted to the DB worker inherit it, see db.submit().
+_current: ContextVar[Optional[_Interaction]] = ContextVar('ballroom_interaction', default=None)
+
+# Statements run outside of any interaction (deferred writes, group commits, startup)
+_background = _Interaction()
+
+_started = time.time()
+_installed = False
+
+def _trace(statement: str) -> None:
+    # The savepoints util.db wraps jobs in are not queries of the handler
+    if statement.startswith(('SAVEPOINT', 'RELEASE')):
+        return
+    (_current.get() or _background).queries += 1
+
+def _observe_job(elapsed: float) -> None:
+    (_current.get() or _background).query_time += elapsed
+
+def install() -> None:
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    db.job_observer = _observe_job
+    db.set_trace_callback(_trace)
+
+def _instrument(name: str, func):
+    if getattr(func, '__ballroom_metrics__', False):
+        return func
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        interaction = _Interaction()
+        token = _current.set(interaction)
+        failed = False
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            histogram = _histograms.get(name)
+            if histogram is None:
+                histogram = _histograms[name] = Histogram()
+            histogram.record(elapsed, failed, interaction.queries, interaction.query_time)
+
+    wrapper.__ballroom_metrics__ = True
+    return wrapper
+
+def instrument_cog(cog) -> None:
+    # Wraps every app command, autocomplete handler and context menu of the cog. Call before adding the cog.
+    install()
+    for command in cog.walk_app_commands():
+        if not isinstance(command, app_commands.Command):
+            continue
+        command._callback = _instrument(command.qualified_name, command._callback)
+        for param in command._params.values():
+            if param.autocomplete is not None:
+                param.autocomplete = _instrument(f'{command.qualified_name} [{param.name}]', param.autocomplete)
+
+    for menu in vars(cog).values():
+        if isinstance(menu, app_commands.ContextMenu):
+            menu._callback = _instrument(f'menu {menu.name}', menu._callback)
+
+def snapshot() -> dict:
+    return {
+        'since': _started,
+        'at': time.time(),
+        'handlers': { name: histogram.summary() for name, histogram in sorted(_histograms.items()) },
+        'background': { 'queries': _background.queries, 'query_ms': _background.query_time * 1000 },
+    }
+
+def write(path: str, data: dict) -> None:
+    # Written to a temporary file first so readers never see a partial file
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
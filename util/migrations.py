@@ -0,0 +1,229 @@
+import logging
+
+from util import db
+from util.errors import SchemaException
+
+_log = logging.getLogger(__name__)
+
+# The schema is changed by the migrations below, which run in order. PRAGMA user_version holds how many
+# of them a database has been through, so each runs exactly once. Never edit a migration that has shipped;
+# append a new one instead.
+
+def _migrate_item_name_key(cursor) -> None:
+    # Databases created before name_key compared names with the UNICODE_NOCASE collation.
+    # SQLite cannot drop a column's collation in place, so the table is rebuilt.
+    cursor.connection.create_function('name_key', 1, db.name_key, deterministic=True)
+    cursor.execute('DROP INDEX IF EXISTS idx_item_user_name')
+    cursor.execute('''CREATE TABLE item_new
+                   (id INTEGER PRIMARY KEY, user_id NOT NULL, name NOT NULL, description NOT NULL, image_url, slot, item_type NOT NULL, duration, name_key NOT NULL UNIQUE, version INTEGER NOT NULL DEFAULT 0)''')
+    cursor.execute('''INSERT INTO item_new (id, user_id, name, description, image_url, slot, item_type, duration, name_key)
+                   SELECT id, user_id, name, description, image_url, slot, item_type, duration, name_key(name) FROM item''')
+    cursor.execute('DROP TABLE item')
+    cursor.execute('ALTER TABLE item_new RENAME TO item')
+
+def _create_tables(cursor) -> None:
+    # The tables as init_db() created them at import time, before there were migrations.
+    # Databases from that time are at version 0 and already have some of this, hence IF NOT EXISTS.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS character
+                   (id INTEGER PRIMARY KEY, user_id, name, description, image_url, health, morale, version INTEGER NOT NULL DEFAULT 0)''')
+    db.ensure_column(cursor, 'character', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS attribute
+        (character_id,
+        attribute_name,
+        value,
+        PRIMARY KEY (character_id, attribute_name)
+        CONSTRAINT fk_character
+            FOREIGN KEY (character_id)
+            REFERENCES character (id)
+            ON DELETE CASCADE
+        )''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS skill
+        (character_id,
+        skill_name,
+        value,
+        PRIMARY KEY (character_id, skill_name)
+        CONSTRAINT fk_character
+            FOREIGN KEY (character_id)
+            REFERENCES character (id)
+            ON DELETE CASCADE
+        )''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS active_character
+        (user_id INTEGER PRIMARY KEY,
+        character_id,
+        CONSTRAINT fk_character
+            FOREIGN KEY (character_id)
+            REFERENCES character (id)
+            ON DELETE CASCADE
+        )''')
+
+    # name_key is the casefolded name, so case-insensitive lookups and uniqueness use the plain BINARY index
+    cursor.execute('''CREATE TABLE IF NOT EXISTS item
+                   (id INTEGER PRIMARY KEY, user_id NOT NULL, name NOT NULL, description NOT NULL, image_url, slot, item_type NOT NULL, duration, name_key NOT NULL UNIQUE, version INTEGER NOT NULL DEFAULT 0)''')
+
+    cursor.execute('PRAGMA table_info(item)')
+    if 'name_key' not in (column[1] for column in cursor.fetchall()):
+        _migrate_item_name_key(cursor)
+    db.ensure_column(cursor, 'item', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_item_user_name ON item (user_id, name_key);''')
+
+    # Trigram index over item names for substring search, kept in sync with item by the triggers below
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'item_name_fts'")
+    fts_exists = cursor.fetchone()[0] != 0
+
+    cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS item_name_fts
+        USING fts5(name, content='item', content_rowid='id', tokenize='trigram')''')
+
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS item_name_fts_insert AFTER INSERT ON item BEGIN
+            INSERT INTO item_name_fts (rowid, name) VALUES (new.id, new.name);
+        END''')
+
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS item_name_fts_delete AFTER DELETE ON item BEGIN
+            INSERT INTO item_name_fts (item_name_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        END''')
+
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS item_name_fts_update AFTER UPDATE OF name ON item BEGIN
+            INSERT INTO item_name_fts (item_name_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            INSERT INTO item_name_fts (rowid, name) VALUES (new.id, new.name);
+        END''')
+
+    if not fts_exists:
+        # Index the items of databases created before the index existed
+        cursor.execute("INSERT INTO item_name_fts (item_name_fts) VALUES ('rebuild')")
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS item_stat
+        (item_id NOT NULL,
+        stat_name NOT NULL,
+        stat_desc NOT NULL,
+        value NOT NULL,
+        PRIMARY KEY (item_id, stat_name)
+        CONSTRAINT fk_item
+            FOREIGN KEY (item_id)
+            REFERENCES item (id)
+            ON DELETE CASCADE
+        )''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS inventory
+        (character_id,
+        item_id,
+        quantity,
+        equipped,
+        PRIMARY KEY (character_id, item_id)
+        CONSTRAINT fk_character
+            FOREIGN KEY (character_id)
+            REFERENCES character (id)
+            ON DELETE CASCADE
+        CONSTRAINT fk_item
+            FOREIGN KEY (item_id)
+            REFERENCES item (id)
+            ON DELETE CASCADE
+        )''')
+
+def _add_lookup_indexes(cursor) -> None:
+    # item.user_id is covered by idx_item_user_name and inventory.character_id by the inventory primary key
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_user ON character (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_name ON character (name)')
+    # Children of foreign keys, so deletes and the version bumps on item edits do not scan
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_inventory_item ON inventory (item_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_active_character_character ON active_character (character_id)')
+
+def _remove_orphans(cursor) -> None:
+    # Foreign keys were declared but never enforced, so rows pointing at deleted parents may exist.
+    # They are dropped so enforcement (switched on for every connection) starts from a consistent database.
+    cursor.execute('PRAGMA foreign_key_check')
+    for table, rowid, _, _ in cursor.fetchall():
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = ?', (rowid,))
+
+def _add_change_log(cursor) -> None:
+    # See util/changelog.py. AUTOINCREMENT so ids are never reused after pruning.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS change_log
+        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        origin INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        key INTEGER
+        )''')
+
+def _add_item_inspect_count(cursor) -> None:
+    # How often each item was inspected, to preload the most popular ones into the item cache at startup
+    db.ensure_column(cursor, 'item', 'inspect_count', 'INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_item_inspect_count ON item (inspect_count)')
+
+def _add_character_name_key(cursor) -> None:
+    # Case-insensitive character names for finding characters by name, and the guild each one was created in.
+    # Characters from before have no guild and can be found from every guild.
+    db.ensure_column(cursor, 'character', 'name_key', 'TEXT')
+    db.ensure_column(cursor, 'character', 'guild_id', 'INTEGER')
+    cursor.execute('SELECT id, name FROM character WHERE name_key IS NULL')
+    rows = cursor.fetchall()
+    cursor.executemany('UPDATE character SET name_key = ? WHERE id = ?', ((db.name_key(name or ''), x) for x, name in rows))
+
+    # Superseded by the name_key indexes
+    cursor.execute('DROP INDEX IF EXISTS idx_character_name')
+    cursor.execute('DROP INDEX IF EXISTS idx_character_user')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_name_key ON character (name_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_user_name_key ON character (user_id, name_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_guild_name_key ON character (guild_id, name_key)')
+
+def _mark_legacy_characters(cursor) -> None:
+    # Characters created outside a guild also have no guild_id, so the ones from before guilds were recorded
+    # get guild_id 0 (charactersvc.LEGACY_GUILD_ID) instead. Only those stay visible from every guild.
+    cursor.execute('UPDATE character SET guild_id = 0 WHERE guild_id IS NULL')
+
+MIGRATIONS = [
+    _create_tables,
+    _add_lookup_indexes,
+    _remove_orphans,
+    _add_change_log,
+    _add_item_inspect_count,
+    _add_character_name_key,
+    _mark_legacy_characters,
+]
+
+def schema_version(connection=None) -> int:
+    return (connection or db.conn).execute('PRAGMA user_version').fetchone()[0]
+
+def migrate() -> int:
+    # Brings db.conn up to the latest schema and returns the number of migrations that ran.
+    # Run once at startup, before anything else uses the database.
+    connection = db.conn
+    version = schema_version(connection)
+    if version > len(MIGRATIONS):
+        raise SchemaException(f'The database is at schema version {version}, newer than this bot knows ({len(MIGRATIONS)}).')
+    if version == len(MIGRATIONS):
+        return 0
+
+    # Enforcement has to be off while tables are rebuilt, or dropping one would cascade to its children.
+    # It cannot be changed inside a transaction.
+    connection.commit()
+    connection.execute('PRAGMA foreign_keys = OFF')
+    migrated = 0
+    try:
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            cursor = connection.cursor()
+            try:
+                # Several bot processes may start at once. The first to take the write lock migrates, the rest skip.
+                cursor.execute('BEGIN IMMEDIATE')
+                if schema_version(connection) >= number:
+                    connection.rollback()
+                    continue
+                migration(cursor)
+                if number == len(MIGRATIONS):
+                    cursor.execute('PRAGMA foreign_key_check')
+                    if cursor.fetchone() is not None:
+                        raise SchemaException(f'The database has rows violating foreign keys after migration {number}.')
+                cursor.execute(f'PRAGMA user_version = {number}')
+                connection.commit()
+                migrated += 1
+            except BaseException:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+            _log.info('Migrated the database to schema version %d (%s)', number, migration.__name__)
+    finally:
+        connection.execute('PRAGMA foreign_keys = ON')
+
+    return migrated